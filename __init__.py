@@ -1,20 +1,27 @@
 from app.utils.PluginClass import PluginClass
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from celery import shared_task
+from celery import shared_task, chord
+from celery.signals import worker_process_init
 from app.utils import DatabaseHandler
 from flask import request
 import os
-from app.api.records.models import RecordUpdate
 from app.api.resources.services import update_cache as update_cache_resources
 from app.api.records.services import update_cache as update_cache_records
 from app.api.users.services import has_role
 from app.api.tasks.services import add_task
 from dotenv import load_dotenv
 from bson.objectid import ObjectId
+from pymongo import ReturnDocument
 import json
-import pdfplumber
-import importlib 
+import time
+import uuid
+from itertools import islice
 from datetime import datetime                                                   
+from .model_registry import preload_models
+from .model_catalog import get_model_catalog
+from .pipeline import process_record_pages, count_pages, get_label_map, stored_processing
+from .metrics import PipelineMetrics, merge_metrics, progress_meta, export_prometheus
+from .result_storage import RESULT_STORAGE, PAGES_COLLECTION, page_documents, to_storage, load_result
 
 load_dotenv()
 
@@ -24,6 +31,189 @@ ORIGINAL_FILES_PATH = os.environ.get('ORIGINAL_FILES_PATH', '')
 plugin_path = os.path.dirname(os.path.abspath(__file__))
 models_path = plugin_path + '/models'
 tessdata_path = plugin_path + '/tessdata'
+# páginas que procesa cada subtarea de un documento
+PAGES_PER_TASK = int(os.environ.get('OCR_PAGES_PER_TASK', 50))
+# tamaño de los lotes de lectura y escritura en la base de datos
+DB_BATCH_SIZE = int(os.environ.get('OCR_DB_BATCH_SIZE', 500))
+# colección con el avance de los trabajos en curso, con los registros de
+# cada trabajo y con las páginas ya procesadas que esperan a que termine su
+# registro
+JOBS_COLLECTION = 'ocrProcessing_jobs'
+JOB_RECORDS_COLLECTION = 'ocrProcessing_job_records'
+JOB_PAGES_COLLECTION = 'ocrProcessing_job_pages'
+# registros de un trabajo que se procesan a la vez; cada registro que
+# termina despacha el siguiente
+RECORDS_IN_FLIGHT = int(os.environ.get('OCR_RECORDS_IN_FLIGHT', 16))
+# fila de Celery para el procesamiento de una sola página desde el editor y
+# segundos que la petición espera su resultado antes de responder
+PAGE_QUEUE = os.environ.get('OCR_PAGE_QUEUE', '')
+PAGE_WAIT = float(os.environ.get('OCR_PAGE_WAIT', 0))
+# cada subtarea acumula sus páginas terminadas y las suma al avance del
+# trabajo cada tantas páginas o segundos
+PROGRESS_PAGES = int(os.environ.get('OCR_PROGRESS_PAGES', 10))
+PROGRESS_SECONDS = float(os.environ.get('OCR_PROGRESS_SECONDS', 5))
+
+@worker_process_init.connect
+def preload_layout_models(**kwargs):
+    preload_models()
+
+def save_page_result(record_id, page_result, body, user, summary=None):
+    # reemplaza solo la entrada de la página en el resultado guardado; si la
+    # página no está se inserta en orden y si el registro no tiene
+    # resultado se crea con esa única página
+    records = mongodb.db['records']
+    existing = body.get('model') == 'existing'
+    model = body.get('model', '*')
+    updated = {'updatedAt': datetime.now(), 'updatedBy': user if user else 'system'}
+
+    # la página se guarda donde ya está el resultado del registro
+    record = mongodb.get_record('records', {'_id': ObjectId(record_id)},
+                                fields={'processing.ocrProcessing.storage': 1, 'processing.ocrProcessing.model': 1})
+    ocr_processing = stored_processing(record)
+    storage = ocr_processing.get('storage', 'record') if ocr_processing else RESULT_STORAGE
+
+    # los bloques de otro modelo no se mezclan con los del resto del registro
+    if ocr_processing and not existing and ocr_processing.get('model') != model:
+        raise Exception(f'El registro {record_id} tiene bloques del modelo {ocr_processing.get("model")}, no de {model}')
+    if not ocr_processing and existing:
+        raise Exception(f'El registro {record_id} no tiene bloques para actualizar')
+
+    # el modelo, las etiquetas y el resumen se actualizan junto con la página;
+    # en modo 'existing' se conservan el modelo y las etiquetas de los bloques
+    processing = {'summary': summary} if existing else {
+        'model': model,
+        'labels': {str(k): v for k, v in get_label_map(body).items()},
+        'summary': summary
+    }
+    processing_update = {f'processing.ocrProcessing.{k}': v for k, v in processing.items() if v is not None}
+    record_filters = {'_id': ObjectId(record_id)} if existing else {'_id': ObjectId(record_id), 'processing.ocrProcessing.model': model}
+    new_processing = {'type': 'lt_extraction', **processing, 'storage': storage}
+
+    if storage == 'pages':
+        page_doc = page_documents(ObjectId(record_id), [page_result])[0]
+        mongodb.db[PAGES_COLLECTION].replace_one({'_id': page_doc['_id']}, page_doc, upsert=True)
+        if ocr_processing:
+            records.update_one(record_filters, {'$set': {**processing_update, **updated}})
+        else:
+            records.update_one({'_id': ObjectId(record_id)}, {'$set': {'processing.ocrProcessing': {**new_processing, 'result': []}, **updated}})
+        return
+
+    page_result = to_storage([page_result])[0]
+    page = page_result['page']
+
+    # cada paso solo aplica si el anterior sigue siendo cierto, así dos
+    # solicitudes simultáneas no duplican la página ni pisan el resultado;
+    # si otra solicitud se adelanta se vuelve a intentar desde el inicio
+    for _ in range(3):
+        update = records.update_one(
+            {**record_filters, 'processing.ocrProcessing.result.page': page},
+            {'$set': {'processing.ocrProcessing.result.$': page_result, **processing_update, **updated}})
+        if update.matched_count > 0:
+            return
+
+        update = records.update_one(
+            {**record_filters, 'processing.ocrProcessing.result': {'$exists': True},
+             'processing.ocrProcessing.result.page': {'$ne': page}},
+            {'$push': {'processing.ocrProcessing.result': {'$each': [page_result], '$sort': {'page': 1}}},
+             '$set': {**processing_update, **updated}})
+        if update.matched_count > 0:
+            return
+
+        if existing:
+            continue
+        update = records.update_one(
+            {'_id': ObjectId(record_id), 'processing.ocrProcessing.result': {'$exists': False}},
+            {'$set': {'processing.ocrProcessing': {**new_processing, 'result': [page_result]}, **updated}})
+        if update.matched_count > 0:
+            return
+
+    # ninguno de los pasos aplicó: el resultado cambió entre cada intento o
+    # el registro pasó a tener bloques de otro modelo
+    raise Exception(f'No se pudo guardar la página {page} del registro {record_id}')
+
+def write_record(record_id, pages, body, user, summary):
+    # escribe el resultado de un registro a partir de sus páginas, que pueden
+    # venir en cualquier orden
+    if body.get('page_only', False):
+        # con una sola página no se reemplaza el resultado completo
+        for page in pages:
+            save_page_result(record_id, {'page': page['page'], 'blocks': page['blocks']}, body, user, summary)
+        return
+
+    if RESULT_STORAGE == 'pages':
+        # el resultado va en un documento por página y el registro solo
+        # guarda el resumen
+        pages_collection = mongodb.db[PAGES_COLLECTION]
+        pages_collection.delete_many({'record': ObjectId(record_id)})
+        pages = iter(pages)
+        while True:
+            page_docs = page_documents(ObjectId(record_id), list(islice(pages, DB_BATCH_SIZE)))
+            if len(page_docs) == 0:
+                break
+            pages_collection.insert_many(page_docs, ordered=False)
+        resp = []
+    else:
+        resp = sorted(({'page': page['page'], 'blocks': page['blocks']} for page in pages), key=lambda p: p['page'])
+
+    # solo se actualiza processing.ocrProcessing
+    if body.get('model') == 'existing':
+        # se conservan el modelo y las etiquetas con que se crearon los bloques
+        update = {
+            'processing.ocrProcessing.storage': RESULT_STORAGE,
+            'processing.ocrProcessing.result': resp,
+            'processing.ocrProcessing.summary': summary
+        }
+    else:
+        update = {
+            'processing.ocrProcessing': {
+                'type': 'lt_extraction',
+                'model': body.get('model', '*'),
+                'labels': {str(k): v for k, v in get_label_map(body).items()},
+                'storage': RESULT_STORAGE,
+                'result': resp,
+                'summary': summary
+            }
+        }
+    mongodb.db['records'].update_one({'_id': ObjectId(record_id)}, {'$set': {
+        **update,
+        'updatedAt': datetime.now(),
+        'updatedBy': user if user else 'system'
+    }})
+
+def dispatch_records(body, user, job_id, n):
+    # cada registro es un chord con sus rangos de páginas; si falla alguna
+    # subtarea el chord no llama a merge_record y el registro se da por
+    # fallido en record_failed
+    for _ in range(n):
+        job_record = mongodb.db[JOB_RECORDS_COLLECTION].find_one_and_update(
+            {'job': job_id, 'status': 'pending'}, {'$set': {'status': 'running'}})
+        if job_record is None:
+            return
+
+        record_id = job_record['record']
+        single = len(job_record['ranges']) == 1
+        subtasks = [ExtendedPluginClass.process_pages.s(body, record_id, start, end, job_id, user, single) for start, end in job_record['ranges']]
+        callback = ExtendedPluginClass.merge_record.s(body, user, job_id, record_id)
+        callback.on_error(ExtendedPluginClass.record_failed.s(body, user, job_id, record_id))
+        chord(subtasks)(callback)
+
+def record_finished(body, user, job_id, record_id, summary=None, error=None):
+    # marca el registro como terminado, despacha el siguiente y, si era el
+    # último del trabajo, lo cierra; una tarea repetida no cuenta dos veces
+    status = {'status': 'done', 'summary': summary} if error is None else {'status': 'failed', 'error': error}
+    update = mongodb.db[JOB_RECORDS_COLLECTION].update_one(
+        {'_id': f'{job_id}:{record_id}', 'status': 'running'}, {'$set': status})
+    if update.matched_count == 0:
+        return
+
+    job = mongodb.db[JOBS_COLLECTION].find_one_and_update(
+        {'_id': job_id}, {'$inc': {'finished': 1, 'failed': 0 if error is None else 1}}, return_document=ReturnDocument.AFTER)
+    if job is None:
+        return
+
+    dispatch_records(body, user, job_id, 1)
+    if job['finished'] == job['records']:
+        ExtendedPluginClass.finish_job.apply_async(args=[job_id], task_id=job_id)
 
 class ExtendedPluginClass(PluginClass):
     def __init__(self, path, import_name, name, description, version, author, type, settings, actions=None, capabilities=None, **kwargs):
@@ -56,6 +246,23 @@ class ExtendedPluginClass(PluginClass):
             
             print(body)
 
+            if body.get('page_only', False) and len(body.get('records', [])) == 1:
+                # una sola página va directo a su propia tarea, sin planificar
+                # un trabajo completo
+                page = body.get('opts', {}).get('page', 1)
+                options = {'queue': PAGE_QUEUE} if PAGE_QUEUE else {}
+                task = self.process_page.apply_async(args=[body, current_user, body['records'][0], page], **options)
+                self.add_task_to_user(task.id, 'ocrProcessing.blockProcessing', current_user, 'msg')
+
+                if PAGE_WAIT > 0:
+                    try:
+                        result = task.get(timeout=PAGE_WAIT)
+                        return {'msg': 'Extracción de texto finalizada', 'result': result}, 200
+                    except Exception as e:
+                        print(str(e))
+
+                return {'msg': 'Se agregó la tarea a la fila de procesamientos'}, 201
+
             task = self.bulk.delay(body, current_user)
             self.add_task_to_user(task.id, 'ocrProcessing.blockProcessing', current_user, 'msg')
             
@@ -64,32 +271,18 @@ class ExtendedPluginClass(PluginClass):
 
     @shared_task(ignore_result=False, name='ocrProcessing.bulk')
     def bulk(body, user):       
-        import cv2
-        import layoutparser as lp
-
-        def check_text_extraction(pdf_path, page):
-            with pdfplumber.open(pdf_path) as pdf:
-                page_ = pdf.pages[page]
-                text = ""
-                text += page_.extract_text()
-            
-            return len(text) > 0
-        
-        def extract_words(pdf_path, page):
-            with pdfplumber.open(pdf_path) as pdf:
-                page_ = pdf.pages[page]
-                words = page_.extract_words()
-                
-            return words, page_.width, page_.height
-        
-        def extract_words_bbox(words, bbox, page_w, page_h):
-            resp = []
-            for word in words:
-                if word['x0'] / page_w >= bbox['x_1'] and word['x1'] / page_w <= bbox['x_2'] and word['top'] / page_h >= bbox['y_1'] and word['bottom'] / page_h <= bbox['y_2']:
-                    resp.append(word)
-            return resp
-
-        if 'records' not in body:
+        fields = {'_id': 1, 'processing.fileProcessing.path': 1}
+        # en modo 'existing' solo sirven los registros que ya tienen bloques
+        existing = body.get('model') == 'existing'
+
+        def iter_records():
+            if 'records' in body:
+                records_filters = {'_id': {'$in': [ObjectId(record) for record in body['records']]}}
+                if existing:
+                    records_filters['processing.ocrProcessing'] = {'$exists': True}
+                yield from mongodb.get_all_records('records', records_filters, fields=fields)
+                return
+
             filters = {
                 'post_type': body['post_type']
             }
@@ -101,245 +294,268 @@ class ExtendedPluginClass(PluginClass):
                 if len(body['resources']) > 0:
                     filters = {'_id': {'$in': [ObjectId(resource) for resource in body['resources']]}, **filters}
 
-            # obtenemos los recursos
-            resources = list(mongodb.get_all_records(
+            # obtenemos los recursos por lotes y los registros de cada lote se
+            # consumen directamente del cursor
+            resources = iter(mongodb.get_all_records(
                 'resources', filters, fields={'_id': 1}))
-            records_filters = {
-                'parent.id': {'$in': resources},
-                'processing.fileProcessing': {'$exists': True},
-                '$or': [{'processing.fileProcessing.type': 'document'}]
-            }
-            if not body['overwrite']:
-                records_filters['processing.ocrProcessing'] = {'$exists': False}
-                
-        else:
-            records_filters = {'_id': {'$in': [ObjectId(record) for record in body['records']]}}
-            
-        records = list(mongodb.get_all_records('records', records_filters, fields={
-            '_id': 1, 'mime': 1, 'filepath': 1, 'processing': 1}))
-
-        if len(records) > 0:
-            page_block = body.get('model', '*') == '*'
-            page_only = body.get('page_only', False)
-            page_to_process = body.get('opts', None)
-            page_to_process = page_to_process.get('page', 1) if page_only else None
-            
-            if not page_block:
-                label_map = importlib.import_module(f'.models.{body["model"]}.label_map', package=__name__)
-                label_map = label_map.list_map[0]
-                model = lp.Detectron2LayoutModel(os.path.join(models_path, body['model'], 'config.yaml'),
-                                                os.path.join(models_path, body['model'], 'model.pth'),
-                                                extra_config=["MODEL.ROI_HEADS.SCORE_THRESH_TEST", 0.7, "MODEL.ROI_BOX_HEAD.FED_LOSS_FREQ_WEIGHT_POWER", 0.5, "MODEL.DEVICE", "cpu"],
-                                                label_map=label_map, device='cpu')
-            
-                ocr_agent = lp.TesseractAgent(languages='spa')
+            while True:
+                chunk = list(islice(resources, DB_BATCH_SIZE))
+                if len(chunk) == 0:
+                    break
+
+                records_filters = {
+                    'parent.id': {'$in': chunk},
+                    'processing.fileProcessing': {'$exists': True},
+                    '$or': [{'processing.fileProcessing.type': 'document'}]
+                }
+                if existing:
+                    records_filters['processing.ocrProcessing'] = {'$exists': True}
+                elif not body['overwrite']:
+                    records_filters['processing.ocrProcessing'] = {'$exists': False}
+
+                yield from mongodb.get_all_records('records', records_filters, fields=fields)
+
+        page_only = body.get('page_only', False)
+        page_to_process = body.get('opts', None)
+        page_to_process = page_to_process.get('page', 1) if page_only else None
+
+        # cada registro se divide en rangos de páginas que se procesan como
+        # subtareas independientes en cualquiera de los workers. El plan se
+        # guarda por lotes en la base de datos y los registros se despachan
+        # de a RECORDS_IN_FLIGHT a medida que terminan los anteriores
+        job_id = str(uuid.uuid4())
+        job_records = mongodb.db[JOB_RECORDS_COLLECTION]
+        job_records.create_index([('job', 1), ('status', 1)])
+        mongodb.db[JOB_PAGES_COLLECTION].create_index([('job', 1), ('record', 1)])
+        total_pages = 0
+        total_records = 0
+
+        def plan(batch):
+            # un registro con varios padres puede aparecer en más de un lote
+            # de recursos; los que ya están en el plan no se repiten
+            planned = {d['_id'] for d in job_records.find({'_id': {'$in': list(batch)}}, {'_id': 1})}
+            docs = [d for _id, d in batch.items() if _id not in planned]
+            if len(docs) > 0:
+                job_records.insert_many(docs, ordered=False)
+            return len(docs), sum(end - start for d in docs for start, end in d['ranges'])
+
+        batch = {}
+        for record in iter_records():
+            _id = f'{job_id}:{record["_id"]}'
+            if _id in batch:
+                continue
+            if page_only:
+                ranges = [[page_to_process - 1, page_to_process]]
             else:
-                label_map = ['Page']
+                total = count_pages(record)
+                ranges = [[start, min(start + PAGES_PER_TASK, total)] for start in range(0, total, PAGES_PER_TASK)] or [[0, 0]]
 
-            
-            ocr_types = body.get('ocr_types', list(label_map.values()))
-            for record in records:
-                path = os.path.join(WEB_FILES_PATH, record['processing']['fileProcessing']['path'], 'web', 'big')
-                path_original = os.path.join(ORIGINAL_FILES_PATH, record['processing']['fileProcessing']['path'] + '.pdf')
-                files = sorted(os.listdir(path))
-                page = 0
-                resp = []
-                
-                for i, f in enumerate(files):
-                    if page_only and page + 1 != page_to_process:
-                        page += 1
-                        continue
-                    
-                    words = None
-                    image = cv2.imread(path + '/' + f)
-                    image = image[..., ::-1]
-                    image_width = image.shape[1]
-                    image_height = image.shape[0]
-                    aspect_ratio = image_width / image_height
-
-                    has_text = check_text_extraction(path_original, page)
-                    if has_text:
-                        words, w_doc, h_doc = extract_words(path_original, page)
-
-                    page += 1
-
-                    layout = model.detect(image)
-
-                    blocks = []
-                    for l in label_map.values():
-                        if not page_block:
-                            _ = lp.Layout([b for b in layout if b.type == l])
-                            blocks.append(_)
-                        else:
-                            if l == 'Page':
-                                _ = {
-                                    'block': {
-                                        'x_1': 0,
-                                        'y_1': 0,
-                                        'x_2': image_width,
-                                        'y_2': image_height
-                                    },
-                                    'type': l
-                                }
-                                blocks.append(_)
-
-                    resp_page = []
-
-                    def segment_image(b, image):
-                        segment_image = (
-                            b.pad(left=5, right=5, top=5,
-                                bottom=5).crop_image(image)
-                        )
-
-                        segment_text = ocr_agent.detect(
-                            segment_image, return_response=True, return_only_text=False)
-                        
-                        txt = segment_text['text']
-
-                        return txt
-                    
-                    def extract_segment_words(words, b):
-                        segment_words = extract_words_bbox(words, {
-                            'x_1': (b.block.x_1 - 50) / image_width,
-                            'y_1': (b.block.y_1 - 50) / image_height,
-                            'x_2': (b.block.x_2 + 50) / image_width,
-                            'y_2': (b.block.y_2 + 50) / image_height
-                        }, w_doc, h_doc)
-
-                        return segment_words
-                    
-                    def get_obj(b, txt, type, segment_words):
-                        obj = {
-                            'text': txt,
-                            'type': type,
-                            'bbox': {
-                                'x': b.block.x_1 / image_width,
-                                'y': b.block.y_1 / image_height,
-                                'width': (b.block.x_2 - b.block.x_1) / image_width,
-                                'height': (b.block.y_2 - b.block.y_1) / image_height
-                            },
-                            'words': [{
-                                'text': s['text'],
-                                'bbox': {
-                                    'x': s['x0'] / w_doc,
-                                    'y': s['top'] / h_doc,
-                                    'width': (s['x1'] - s['x0']) / w_doc,
-                                    'height': (s['bottom'] - s['top']) / h_doc
-                                }
-                            } for s in segment_words]
-                        }
-                        return obj
-                    
-                    for block in blocks:
-                        for b in block:
-                            if b.type in ocr_types:
-                                txt = ''
-                                segment_words = []
-
-                                if not has_text:
-                                    txt = segment_image(b, image)
-                                else:
-                                    segment_words = extract_segment_words(words, b)
-                                    for w in segment_words:
-                                        txt += w['text'] + ' '
-
-                                obj = get_obj(b, txt, b.type, segment_words)
-
-                                resp_page.append(obj)
-                            else:
-                                obj = {
-                                    'type': b.type,
-                                    'bbox': {
-                                        'x': b.block.x_1 / image_width,
-                                        'y': b.block.y_1 / image_height,
-                                        'width': (b.block.x_2 - b.block.x_1) / image_width,
-                                        'height': (b.block.y_2 - b.block.y_1) / image_height
-                                    }
-                                }
-
-                                resp_page.append(obj)
-
-                    resp.append({
-                        'page': page,
-                        'blocks': resp_page
-                    })
-
-                update = {
-                    'processing': record['processing']
-                }
+            batch[_id] = {'_id': _id, 'job': job_id, 'record': str(record['_id']), 'ranges': ranges, 'status': 'pending'}
+            if len(batch) >= DB_BATCH_SIZE:
+                records_planned, pages_planned = plan(batch)
+                total_records += records_planned
+                total_pages += pages_planned
+                batch = {}
 
-                string_label_map = {str(k): v for k, v in label_map.items()}
+        if len(batch) > 0:
+            records_planned, pages_planned = plan(batch)
+            total_records += records_planned
+            total_pages += pages_planned
 
-                update['processing']['ocrProcessing'] = {
-                    'type': 'lt_extraction',
-                    'model': body['model'],
-                    'labels': string_label_map,
-                    'result': resp
-                }
-                update['updatedAt'] = datetime.now()
-                update['updatedBy'] = user if user else 'system'
+        instance = ExtendedPluginClass('ocrProcessing','', **plugin_info)
 
-                update = RecordUpdate(**update)
-                mongodb.update_record(
-                    'records', {'_id': record['_id']}, update)
+        if total_records == 0:
+            instance.clear_cache()
+            return 'Extracción de texto finalizada'
+
+        # el avance del trabajo se cuenta en la base de datos y se publica en
+        # el estado de la tarea final, que es la que ve el usuario
+        mongodb.db[JOBS_COLLECTION].insert_one({
+            '_id': job_id,
+            'total': total_pages,
+            'done': 0,
+            'published': 0,
+            'records': total_records,
+            'finished': 0,
+            'failed': 0,
+            'startedAt': time.time()
+        })
+
+        if user:
+            instance.add_task_to_user(job_id, 'ocrProcessing.bulk', user, 'msg')
+        dispatch_records(body, user, job_id, RECORDS_IN_FLIGHT)
+
+        return f'Se programó la extracción de texto de {total_records} registros'
+
+    # si el worker muere la subtarea vuelve a la cola y retoma desde las
+    # páginas que ya quedaron en la caché
+    @shared_task(ignore_result=False, name='ocrProcessing.process_pages', acks_late=True, reject_on_worker_lost=True)
+    def process_pages(body, record_id, start, end, job_id, user=None, single=False):
+        fields = {'_id': 1, 'processing.fileProcessing.path': 1}
+        if body.get('model') == 'existing':
+            fields['processing.ocrProcessing'] = 1
+        record = mongodb.get_record('records', {'_id': ObjectId(record_id)}, fields=fields)
+        ocr_processing = stored_processing(record)
+        if body.get('model') == 'existing' and ocr_processing:
+            ocr_processing['result'] = load_result(ocr_processing, mongodb.db, record['_id'], start, end)
+        metrics = PipelineMetrics()
+
+        progress = {'pending': 0, 'flushed': time.monotonic()}
+
+        def report_progress():
+            if progress['pending'] == 0:
+                return
+            job = mongodb.db[JOBS_COLLECTION].find_one_and_update(
+                {'_id': job_id}, {'$inc': {'done': progress['pending']}}, return_document=ReturnDocument.AFTER)
+            progress['pending'] = 0
+            progress['flushed'] = time.monotonic()
+            # con varias subtareas a la vez un avance leído antes puede
+            # llegar después; solo se publica si supera al ya publicado
+            if job and mongodb.db[JOBS_COLLECTION].update_one(
+                    {'_id': job_id, 'published': {'$lt': job['done']}}, {'$set': {'published': job['done']}}).matched_count > 0:
+                ExtendedPluginClass.finish_job.update_state(
+                    task_id=job_id, state='PROGRESS', meta=progress_meta(job['done'], job['total'], job['startedAt']))
+
+        def on_progress(n):
+            progress['pending'] += n
+            if progress['pending'] >= PROGRESS_PAGES or time.monotonic() - progress['flushed'] >= PROGRESS_SECONDS:
+                report_progress()
+
+        try:
+            result = process_record_pages(record, body, start, end, metrics=metrics, on_progress=on_progress, scope=job_id)
+        finally:
+            report_progress()
+
+        if single:
+            # un registro de un solo rango se escribe aquí mismo, sin pasar
+            # por las páginas en espera
+            write_start = time.perf_counter()
+            write_record(record_id, to_storage(result), body, user, merge_metrics([metrics.to_dict()]))
+            return {
+                'record': record_id,
+                'start': start,
+                'metrics': metrics.to_dict(),
+                'db_write': time.perf_counter() - write_start
+            }
+
+        # las páginas esperan en la base de datos a que termine el registro;
+        # la tarea solo devuelve sus métricas. Si se repite, reemplaza las
+        # páginas de su rango
+        staged = mongodb.db[JOB_PAGES_COLLECTION]
+        staged.delete_many({'job': job_id, 'record': record_id, 'page': {'$gt': start, '$lte': end}})
+        page_docs = [{
+            '_id': f'{job_id}:{record_id}:{page["page"]}',
+            'job': job_id,
+            'record': record_id,
+            'page': page['page'],
+            'blocks': page['blocks']
+        } for page in to_storage(result)]
+        for batch_start in range(0, len(page_docs), DB_BATCH_SIZE):
+            staged.insert_many(page_docs[batch_start:batch_start + DB_BATCH_SIZE], ordered=False)
+
+        return {
+            'record': record_id,
+            'start': start,
+            'metrics': metrics.to_dict()
+        }
+
+    @shared_task(ignore_result=False, name='ocrProcessing.process_page')
+    def process_page(body, user, record_id, page):
+        fields = {'_id': 1, 'processing.fileProcessing.path': 1}
+        if body.get('model') == 'existing':
+            fields['processing.ocrProcessing'] = 1
+        else:
+            fields['processing.ocrProcessing.model'] = 1
+        record = mongodb.get_record('records', {'_id': ObjectId(record_id)}, fields=fields)
+        ocr_processing = stored_processing(record)
+        # igual que en bulk, el modo 'existing' solo sirve para registros con
+        # bloques y los bloques de otro modelo no se mezclan con los nuevos
+        if body.get('model') == 'existing':
+            if not ocr_processing:
+                return 'El registro no tiene bloques para actualizar'
+            ocr_processing['result'] = load_result(ocr_processing, mongodb.db, record['_id'], page - 1, page)
+        elif ocr_processing and ocr_processing.get('model') != body.get('model', '*'):
+            return f'El registro tiene bloques del modelo {ocr_processing.get("model")}; para usar otro modelo se debe procesar el documento completo'
+        metrics = PipelineMetrics()
+
+        result = process_record_pages(record, body, page - 1, page, metrics=metrics)
+        for page_result in result:
+            save_page_result(record_id, page_result, body, user, merge_metrics([metrics.to_dict()]))
 
         instance = ExtendedPluginClass('ocrProcessing','', **plugin_info)
         instance.clear_cache()
+        return result
+
+    @shared_task(ignore_result=False, name='ocrProcessing.merge_record')
+    def merge_record(results, body, user, job_id, record_id):
+        # escribe el resultado de un registro con las páginas que dejaron sus
+        # subtareas; si el registro tenía un solo rango ya lo escribió su
+        # subtarea y aquí solo se da por terminado
+        summary = merge_metrics([r['metrics'] for r in results])
+        if 'db_write' in results[0]:
+            summary['stages']['db_write'] = results[0]['db_write']
+        else:
+            staged = mongodb.db[JOB_PAGES_COLLECTION]
+            staged_filters = {'job': job_id, 'record': record_id}
+            write_start = time.perf_counter()
+            write_record(record_id, staged.find(staged_filters), body, user, summary)
+            staged.delete_many(staged_filters)
+            # el tiempo de escritura solo entra en el resumen del trabajo
+            summary['stages']['db_write'] = time.perf_counter() - write_start
+        record_finished(body, user, job_id, record_id, summary)
+
+    @shared_task(name='ocrProcessing.record_failed')
+    def record_failed(request, exc, traceback, body, user, job_id, record_id):
+        # errback del chord de un registro: se descartan sus páginas y el
+        # registro queda como fallido sin detener el resto del trabajo
+        mongodb.db[JOB_PAGES_COLLECTION].delete_many({'job': job_id, 'record': record_id})
+        record_finished(body, user, job_id, record_id, error=repr(exc))
+
+    @shared_task(ignore_result=False, name='ocrProcessing.finish_job')
+    def finish_job(job_id):
+        # resume el trabajo con los resúmenes de sus registros y borra lo que
+        # quedó de él en la base de datos; en el resumen las páginas más
+        # lentas indican a qué registro pertenecen
+        job = mongodb.db[JOBS_COLLECTION].find_one_and_delete({'_id': job_id})
+        job_records = mongodb.db[JOB_RECORDS_COLLECTION]
+
+        summary = merge_metrics(
+            {**r['summary'], 'pages': [{**page, 'record': r['record']} for page in r['summary']['pages']]}
+            for r in job_records.find({'job': job_id, 'status': 'done'}))
+        summary['counters']['records'] = job['records'] if job else 0
+        summary['counters']['failed_records'] = job['failed'] if job else 0
+        summary['seconds'] = time.time() - job['startedAt'] if job else 0
+        export_prometheus(summary)
+
+        job_records.delete_many({'job': job_id})
+        mongodb.db[JOB_PAGES_COLLECTION].delete_many({'job': job_id})
+
+        instance = ExtendedPluginClass('ocrProcessing','', **plugin_info)
+        instance.clear_cache()
+        if job and job['failed'] > 0:
+            return f'Extracción de texto finalizada; {job["failed"]} de {job["records"]} registros fallaron'
         return 'Extracción de texto finalizada'
 
     def get_actions(self):
+        # las acciones con el formulario de modelos se arman una vez por
+        # versión del catálogo y no se modifica self.actions
+        catalog = get_model_catalog()
+        cached = getattr(self, '_actions_cache', None)
+        if cached is not None and cached[0] == catalog['version'] and cached[1] is self.actions:
+            return cached[2]
+
+        actions = []
         for a in self.actions:
             if 'placement' in a:
                 if a['placement'] == 'detail_record':
                     form = a.get('extraOpts', [])
-
                     # Check if model selection already exists in form
                     if not any(opt.get('id') == 'model' for opt in form):
-                        template_folders = os.listdir(models_path)
-                        template_folders = [t for t in template_folders if os.path.isdir(os.path.join(models_path, t))]
-                        template_folders = [t for t in template_folders if t != '__pycache__']
-                        
-                        model_block = {
-                            'type': 'select',
-                            'id': 'model',
-                            'label': 'Modelo de segmentación',
-                            'default': '*',
-                            'options': [{'value': '*', 'label': 'Detectar un único bloque en toda la página'}, {'value': 'existing', 'label': 'Usar los bloques guardados en el sistema'}] + [{'value': t, 'label': t} for t in template_folders],
-                        }
-                        
-                        condi_block = {
-                            'type': 'condition',
-                            'id': 'ocr_types',
-                            'label': 'Tipos de segmentación para OCR',
-                            'default': [],
-                            'id_condition': 'model',
-                            'condition': '==',
-                            'options': [],
-                        }
-                        for folder in template_folders:
-                            label_map = importlib.import_module(f'.models.{folder}.label_map', package=__name__)
-                            label_map = label_map.list_map[0]
-                            label_map = [{'label': label_map[key], 'value': label_map[key]} for key in label_map]
-
-                            condi_block['options'].append({
-                                'value': folder,
-                                'fields': [
-                                    {
-                                        'type': 'multiple-checkbox',
-                                        'label': '',
-                                        'id': folder + '_ocrtypes',
-                                        'default': [],
-                                        'required': False,
-                                        'options': label_map
-                                    }
-                                ]
-                            })
-                            
-                        form = [model_block] + [condi_block] + form
-                        
-                        a['extraOpts'] = form
-                    
-        return self.actions
+                        a = {**a, 'extraOpts': catalog['action_blocks'] + form}
+            actions.append(a)
+
+        self._actions_cache = (catalog['version'], self.actions, actions)
+        return actions
 
     def get_settings(self):
         @self.route('/settings/<type>', methods=['GET'])
@@ -356,51 +572,7 @@ class ExtendedPluginClass(PluginClass):
                 elif type == 'settings':
                     return self.settings['settings']
                 elif type == 'bulk':
-                    # obtenemos todos los directorios en models_path
-                    template_folders = os.listdir(models_path)
-                    template_folders = [t for t in template_folders if os.path.isdir(os.path.join(models_path, t))]
-                    template_folders = [t for t in template_folders if t != '__pycache__']
-
-                    resp = [*self.settings['settings_bulk']]
-                    resp.append({
-                        'type': 'select',
-                        'id': 'model',
-                        'label': 'Modelo de segmentación',
-                        'default': '',
-                        'options': [{'value': t, 'label': t} for t in template_folders],
-                        'required': True
-                    })
-
-                    condi_block = {
-                        'type': 'condition',
-                        'id': 'ocr_types',
-                        'label': 'Tipos de segmentación para OCR',
-                        'default': [],
-                        'id_condition': 'model',
-                        'condition': '==',
-                        'options': [],
-                    }
-                    for folder in template_folders:
-                        label_map = importlib.import_module(f'.models.{folder}.label_map', package=__name__)
-                        label_map = label_map.list_map[0]
-                        label_map = [{'label': label_map[key], 'value': label_map[key]} for key in label_map]
-
-                        condi_block['options'].append({
-                            'value': folder,
-                            'fields': [
-                                {
-                                    'type': 'multiple-checkbox',
-                                    'label': '',
-                                    'id': folder + '_ocrtypes',
-                                    'default': [],
-                                    'required': False,
-                                    'options': label_map
-                                }
-                            ]
-                        })
-
-                    resp.append(condi_block)
-                    return resp
+                    return [*self.settings['settings_bulk']] + get_model_catalog()['bulk_blocks']
                 elif type == 'block':
                     return self.settings['settings_block']
                 else:
@@ -0,0 +1,87 @@
+# Microbenchmark: asignación de palabras a bloques con WordIndex frente al
+# recorrido lineal original de extract_words_bbox, sobre páginas sintéticas.
+#
+#   python benchmarks/bench_word_index.py --words 5000 --blocks 40
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from word_index import WordIndex
+
+
+def extract_words_bbox(words, bbox, page_w, page_h):
+    resp = []
+    for word in words:
+        if word['x0'] / page_w >= bbox['x_1'] and word['x1'] / page_w <= bbox['x_2'] and word['top'] / page_h >= bbox['y_1'] and word['bottom'] / page_h <= bbox['y_2']:
+            resp.append(word)
+    return resp
+
+
+def synthetic_page(n_words, page_w=612, page_h=792, seed=0):
+    rnd = random.Random(seed)
+    words = []
+    for i in range(n_words):
+        x0 = rnd.uniform(0, page_w - 40)
+        top = rnd.uniform(0, page_h - 12)
+        words.append({
+            'text': 'w%d' % i,
+            'x0': x0,
+            'x1': x0 + rnd.uniform(5, 40),
+            'top': top,
+            'bottom': top + rnd.uniform(6, 12)
+        })
+    return words, page_w, page_h
+
+
+def synthetic_blocks(n_blocks, image_w=1700, image_h=2200, seed=1):
+    rnd = random.Random(seed)
+    blocks = []
+    for _ in range(n_blocks):
+        x_1 = rnd.uniform(0, image_w * 0.8)
+        y_1 = rnd.uniform(0, image_h * 0.8)
+        x_2 = x_1 + rnd.uniform(50, image_w * 0.3)
+        y_2 = y_1 + rnd.uniform(20, image_h * 0.2)
+        # mismo relleno de ±50px que extract_segment_words
+        blocks.append({
+            'x_1': (x_1 - 50) / image_w,
+            'y_1': (y_1 - 50) / image_h,
+            'x_2': (x_2 + 50) / image_w,
+            'y_2': (y_2 + 50) / image_h
+        })
+    return blocks
+
+
+def run(n_words, n_blocks, repeat):
+    words, page_w, page_h = synthetic_page(n_words)
+    blocks = synthetic_blocks(n_blocks)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        linear = [extract_words_bbox(words, b, page_w, page_h) for b in blocks]
+    t_linear = (time.perf_counter() - start) / repeat
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        index = WordIndex(words, page_w, page_h)
+        indexed = [index.query(b) for b in blocks]
+    t_index = (time.perf_counter() - start) / repeat
+
+    assert linear == indexed, 'WordIndex no coincide con extract_words_bbox'
+
+    print('words=%d blocks=%d linear=%.2fms index=%.2fms speedup=%.1fx' % (
+        n_words, n_blocks, t_linear * 1000, t_index * 1000, t_linear / t_index))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--words', type=int, nargs='+', default=[200, 2000, 10000])
+    parser.add_argument('--blocks', type=int, default=40)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for n in args.words:
+        run(n, args.blocks, args.repeat)
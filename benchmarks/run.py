@@ -0,0 +1,294 @@
+# Benchmark del pipeline de ocrProcessing sin una instalación de Archihub.
+#
+# Ejecuta la tarea `bulk` del plugin contra sustitutos en memoria de la base
+# de datos y de Celery, sobre documentos sintéticos, y reporta por escenario
+# páginas por segundo, tiempo por etapa y memoria máxima en JSON:
+#
+#   python benchmarks/run.py --pages 20 --output bench.json
+#   python benchmarks/run.py --pages 20 --compare bench.json
+#
+# Cada escenario corre en un proceso aparte para que la memoria máxima no
+# se contamine entre escenarios.
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+bench_path = os.path.dirname(os.path.abspath(__file__))
+plugin_path = os.path.dirname(bench_path)
+sys.path.insert(0, bench_path)
+
+BENCH_MODEL = 'bench'
+BENCH_LABELS = {0: 'Title', 1: 'Text'}
+
+SCENARIOS = {
+    'text_layer': {'model': '*', 'text_layer': True},
+    'page_ocr': {'model': '*', 'text_layer': False},
+    'layout_text': {'model': BENCH_MODEL, 'text_layer': True, 'ocr_types': ['Title', 'Text']},
+    'layout_ocr': {'model': BENCH_MODEL, 'text_layer': False, 'ocr_types': ['Title', 'Text']},
+}
+
+STAGES = {}
+
+
+def timed(stage, fn, items=None):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            entry = STAGES.setdefault(stage, {'seconds': 0.0, 'calls': 0, 'items': 0})
+            entry['seconds'] += time.perf_counter() - start
+            entry['calls'] += 1
+            entry['items'] += items(*args, **kwargs) if items else 1
+    return wrapper
+
+
+def timed_iter(stage, fn):
+    def wrapper(*args, **kwargs):
+        it = fn(*args, **kwargs)
+        step = timed(stage, lambda: next(it, StopIteration))
+        try:
+            while True:
+                value = step()
+                if value is StopIteration:
+                    return
+                yield value
+        finally:
+            it.close()
+    return wrapper
+
+
+class DummyLayoutModel:
+    # Modelo de layout mínimo: agrupa las filas con tinta en bandas y cada
+    # banda es un bloque; la primera banda es el título.
+    def __init__(self, label_map):
+        self.label_map = label_map
+
+    def detect(self, image):
+        import numpy as np
+        import layoutparser as lp
+
+        ink = (image.min(axis=2) < 128).sum(axis=1) > 0
+        rows = np.flatnonzero(ink)
+        blocks = []
+        if len(rows) > 0:
+            gap = max(2, image.shape[0] // 100)
+            breaks = np.flatnonzero(np.diff(rows) > gap)
+            starts = np.concatenate(([rows[0]], rows[breaks + 1]))
+            ends = np.concatenate((rows[breaks], [rows[-1]]))
+            for i, (y_1, y_2) in enumerate(zip(starts, ends)):
+                cols = np.flatnonzero((image[y_1:y_2 + 1].min(axis=2) < 128).any(axis=0))
+                blocks.append(lp.TextBlock(lp.Rectangle(float(cols[0]), float(y_1), float(cols[-1]), float(y_2)),
+                                           type='Title' if i == 0 else 'Text', score=1.0))
+        return lp.Layout(blocks)
+
+
+class NullOCRPool:
+    def map(self, images):
+        return ['' for _ in images]
+
+
+def load_plugin(work):
+    import standins
+    standins.install()
+
+    spec = importlib.util.spec_from_file_location('ocrProcessing', os.path.join(plugin_path, '__init__.py'),
+                                                  submodule_search_locations=[plugin_path])
+    plugin = importlib.util.module_from_spec(spec)
+    sys.modules['ocrProcessing'] = plugin
+    spec.loader.exec_module(plugin)
+
+    # modelo de prueba en un directorio temporal, registrado como paquete
+    import types
+    from ocrProcessing import model_registry
+
+    models = os.path.join(work, 'models')
+    folder = os.path.join(models, BENCH_MODEL)
+    os.makedirs(folder, exist_ok=True)
+    for f in ('__init__.py', 'config.yaml', 'model.pth'):
+        open(os.path.join(folder, f), 'w').close()
+    with open(os.path.join(folder, 'label_map.py'), 'w') as f:
+        f.write('list_map = [%r]\n' % BENCH_LABELS)
+
+    package = types.ModuleType('ocrProcessing.models')
+    package.__path__ = [models]
+    sys.modules['ocrProcessing.models'] = package
+
+    model_registry.models_path = models
+    model_registry._load = lambda name: {'model': DummyLayoutModel(model_registry.load_label_map(name)),
+                                         'label_map': model_registry.load_label_map(name), 'size': 0}
+    return plugin, standins
+
+
+def instrument(plugin, standins, ocr):
+    from ocrProcessing import pipeline, page_image
+
+    pipeline.iter_text_layer = timed_iter('text_layer', pipeline.iter_text_layer)
+    pipeline.WordIndex = timed('word_index', pipeline.WordIndex)
+    pipeline.detect_batch = timed('detect', pipeline.detect_batch, items=lambda model, images: len(images))
+    page_image.PageImage.reduced = timed('decode_reduced', page_image.PageImage.reduced)
+    page_image.PageImage.full = timed('decode_full', page_image.PageImage.full)
+    standins.Collection.bulk_write = timed('db_write', standins.Collection.bulk_write, items=lambda self, ops, **k: len(ops))
+
+    pool = pipeline.get_ocr_pool() if ocr else NullOCRPool()
+    pool.map = timed('ocr', pool.map, items=lambda images: len(images))
+    pipeline.get_ocr_pool = lambda: pool
+
+
+def tesseract_available():
+    try:
+        import tesserocr
+        return True
+    except ImportError:
+        return shutil.which('tesseract') is not None
+
+
+def run_child(args):
+    scenario = SCENARIOS[args.child]
+    os.environ['WEB_FILES_PATH'] = os.path.join(args.data, 'web')
+    os.environ['ORIGINAL_FILES_PATH'] = os.path.join(args.data, 'original')
+    os.environ['OCR_CACHE_BACKEND'] = args.cache
+    os.environ['OCR_CACHE_PATH'] = os.path.join(args.work, 'cache')
+
+    plugin, standins = load_plugin(args.work)
+    ocr = args.ocr == 'tesseract' or (args.ocr == 'auto' and tesseract_available())
+    instrument(plugin, standins, ocr)
+
+    from bson.objectid import ObjectId
+
+    set_name = 'text' if scenario['text_layer'] else 'scan'
+    records = standins.DatabaseHandler()['records']
+    ids = []
+    for i in range(args.documents):
+        _id = ObjectId()
+        records.insert_one({'_id': _id, 'processing': {'fileProcessing': {'type': 'document', 'path': f'{set_name}/doc{i}'}}})
+        ids.append(str(_id))
+
+    body = {'records': ids, 'model': scenario['model'], 'overwrite': True}
+    if 'ocr_types' in scenario:
+        body['ocr_types'] = scenario['ocr_types']
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    plugin.ExtendedPluginClass.bulk(body, 'bench')
+    elapsed = time.perf_counter() - start
+    rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    pages = args.documents * args.pages
+    blocks = sum(len(p['blocks']) for r in records.docs.values() for p in r['processing']['ocrProcessing']['result'])
+
+    # contadores que el propio pipeline guarda en el resumen de cada registro
+    counters = {}
+    for r in records.docs.values():
+        for name, n in r['processing']['ocrProcessing']['summary']['counters'].items():
+            counters[name] = counters.get(name, 0) + n
+
+    for entry in STAGES.values():
+        entry['items_per_sec'] = entry['items'] / entry['seconds'] if entry['seconds'] > 0 else None
+
+    print(json.dumps({
+        'pages': pages,
+        'blocks': blocks,
+        'seconds': elapsed,
+        'pages_per_sec': pages / elapsed,
+        'ocr': 'tesseract' if ocr else 'none',
+        'peak_rss_mb': rss_peak / 1024,
+        'peak_rss_delta_mb': (rss_peak - rss_before) / 1024,
+        'counters': counters,
+        'stages': STAGES
+    }))
+
+
+def compare(current, baseline, threshold):
+    regressions = []
+    print('%-14s %12s %12s %8s' % ('scenario', 'baseline', 'current', 'change'))
+    for name, result in current['scenarios'].items():
+        if name not in baseline.get('scenarios', {}):
+            continue
+        before = baseline['scenarios'][name]['pages_per_sec']
+        after = result['pages_per_sec']
+        change = (after - before) / before
+        print('%-14s %10.2f/s %10.2f/s %+7.1f%%' % (name, before, after, change * 100))
+        if change < -threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--documents', type=int, default=2)
+    parser.add_argument('--pages', type=int, default=10)
+    parser.add_argument('--lines', type=int, default=40)
+    parser.add_argument('--dpi', type=int, default=200)
+    parser.add_argument('--ocr', choices=['auto', 'tesseract', 'none'], default='auto')
+    parser.add_argument('--cache', choices=['none', 'disk'], default='none')
+    parser.add_argument('--output', help='archivo JSON con los resultados')
+    parser.add_argument('--compare', help='resultados anteriores para comparar')
+    parser.add_argument('--threshold', type=float, default=0.1, help='caída máxima de páginas/s aceptada')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--data', help=argparse.SUPPRESS)
+    parser.add_argument('--work', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return run_child(args)
+
+    from synthetic import make_document
+
+    data = tempfile.mkdtemp(prefix='ocrbench-')
+    try:
+        for set_name, text_layer in (('text', True), ('scan', False)):
+            for i in range(args.documents):
+                make_document(os.path.join(data, 'web'), os.path.join(data, 'original'), f'{set_name}/doc{i}',
+                              args.pages, text_layer=text_layer, n_lines=args.lines, dpi=args.dpi, seed=i)
+
+        results = {}
+        for name in args.scenarios:
+            work = tempfile.mkdtemp(dir=data)
+            cmd = [sys.executable, os.path.abspath(__file__), '--child', name, '--data', data, '--work', work,
+                   '--documents', str(args.documents), '--pages', str(args.pages), '--ocr', args.ocr, '--cache', args.cache]
+            out = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, text=True).stdout
+            results[name] = json.loads(out.strip().splitlines()[-1])
+            print('%-14s %8.2f pages/s  peak %.0f MB' % (name, results[name]['pages_per_sec'], results[name]['peak_rss_mb']), file=sys.stderr)
+    finally:
+        shutil.rmtree(data, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'documents': args.documents,
+            'pages': args.pages,
+            'lines': args.lines,
+            'dpi': args.dpi,
+            'cache': args.cache
+        },
+        'scenarios': results
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            print('Regresión en: ' + ', '.join(regressions), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,331 @@
+# Sustitutos en memoria de Archihub (DatabaseHandler, PluginClass, servicios)
+# y de Celery para poder ejecutar la lógica de `bulk` fuera de una instalación
+# completa. Solo los usan los benchmarks.
+import sys
+import types
+import uuid
+import copy
+import collections
+import importlib
+
+
+def _get(doc, path):
+    for part in path.split('.'):
+        if not isinstance(doc, dict) or part not in doc:
+            return None, False
+        doc = doc[part]
+    return doc, True
+
+
+def _values(doc, parts, position=None):
+    # valores de una ruta recorriendo los arreglos, con la posición del
+    # elemento del primer arreglo (para el operador posicional $)
+    if len(parts) == 0:
+        yield doc, position
+        return
+    if isinstance(doc, list):
+        for i, item in enumerate(doc):
+            yield from _values(item, parts, i if position is None else position)
+    elif isinstance(doc, dict) and parts[0] in doc:
+        yield from _values(doc[parts[0]], parts[1:], position)
+
+
+def _set(doc, path, value):
+    parts = path.split('.')
+    for part in parts[:-1]:
+        doc = doc[int(part)] if isinstance(doc, list) else doc.setdefault(part, {})
+    if isinstance(doc, list):
+        doc[int(parts[-1])] = value
+    else:
+        doc[parts[-1]] = value
+
+
+def _match(doc, filters):
+    # devuelve (coincide, posición del elemento que coincidió en un arreglo)
+    position = None
+    for key, cond in filters.items():
+        if key == '$or':
+            if not any(match(doc, f) for f in cond):
+                return False, None
+            continue
+
+        values = list(_values(doc, key.split('.')))
+        if isinstance(cond, dict) and any(k.startswith('$') for k in cond):
+            if '$exists' in cond and cond['$exists'] != (len(values) > 0):
+                return False, None
+            if '$ne' in cond and any(v == cond['$ne'] for v, _ in values):
+                return False, None
+            if '$in' in cond:
+                values = [(v, i) for v, i in values if v in cond['$in']]
+                if len(values) == 0:
+                    return False, None
+            for op, test in (('$gt', lambda a, b: a > b), ('$lt', lambda a, b: a < b), ('$lte', lambda a, b: a <= b)):
+                if op in cond:
+                    values = [(v, i) for v, i in values if test(v, cond[op])]
+                    if len(values) == 0:
+                        return False, None
+        else:
+            values = [(v, i) for v, i in values if v == cond]
+            if len(values) == 0:
+                return False, None
+        if len(values) > 0 and values[0][1] is not None:
+            position = values[0][1]
+    return True, position
+
+
+def match(doc, filters):
+    return _match(doc, filters)[0]
+
+
+class UpdateOne:
+    def __init__(self, filter, update, upsert=False):
+        self.filter = filter
+        self.update = update
+
+
+class ReturnDocument:
+    BEFORE = False
+    AFTER = True
+
+
+class Collection:
+    def __init__(self):
+        self.docs = {}
+        self.writes = 0
+
+    def find(self, filters=None, fields=None):
+        return (copy.deepcopy(d) for d in list(self.docs.values()) if match(d, filters or {}))
+
+    def insert_one(self, doc):
+        doc.setdefault('_id', uuid.uuid4().hex)
+        self.docs[doc['_id']] = doc
+
+    def update_one(self, filters, update, array_filters=None):
+        for doc in self.docs.values():
+            matched, position = _match(doc, filters)
+            if matched:
+                for path, value in update.get('$set', {}).items():
+                    _set(doc, path.replace('.$', '.%s' % position), copy.deepcopy(value))
+                for path, value in update.get('$push', {}).items():
+                    items, _ = _get(doc, path)
+                    items.extend(copy.deepcopy(value['$each']))
+                    for key, order in value.get('$sort', {}).items():
+                        items.sort(key=lambda item: item[key], reverse=order < 0)
+                return types.SimpleNamespace(matched_count=1)
+        return types.SimpleNamespace(matched_count=0)
+
+    def insert_many(self, docs, ordered=True):
+        for doc in docs:
+            self.insert_one(copy.deepcopy(doc))
+
+    def replace_one(self, filters, doc, upsert=False):
+        old = next((d for d in self.docs.values() if match(d, filters)), None)
+        if old is not None:
+            del self.docs[old['_id']]
+        if old is not None or upsert:
+            self.insert_one(copy.deepcopy(doc))
+        return types.SimpleNamespace(matched_count=1 if old is not None else 0)
+
+    def create_index(self, keys, **kwargs):
+        pass
+
+    def delete_many(self, filters):
+        for doc in [d for d in self.docs.values() if match(d, filters)]:
+            del self.docs[doc['_id']]
+
+    def find_one_and_update(self, filters, update, return_document=False):
+        doc = next((d for d in self.docs.values() if match(d, filters)), None)
+        if doc is None:
+            return None
+        before = copy.deepcopy(doc)
+        for path, value in update.get('$inc', {}).items():
+            _set(doc, path, (_get(doc, path)[0] or 0) + value)
+        for path, value in update.get('$set', {}).items():
+            _set(doc, path, copy.deepcopy(value))
+        return copy.deepcopy(doc) if return_document else before
+
+    def find_one_and_delete(self, filters):
+        doc = next((d for d in self.docs.values() if match(d, filters)), None)
+        if doc is not None:
+            del self.docs[doc['_id']]
+        return doc
+
+    def bulk_write(self, operations, ordered=True):
+        self.writes += 1
+        for op in operations:
+            self.update_one(op.filter, op.update)
+
+
+class DatabaseHandler:
+    # todas las instancias comparten las mismas colecciones
+    collections = {}
+
+    def __init__(self, *args, **kwargs):
+        self.db = self
+
+    def __getitem__(self, name):
+        return self.collections.setdefault(name, Collection())
+
+    def get_all_records(self, collection, filters={}, sort=None, limit=0, skip=0, fields=None):
+        return self[collection].find(filters, fields)
+
+    def get_record(self, collection, filters, fields=None):
+        return next(self[collection].find(filters, fields), None)
+
+
+class PluginClass:
+    def __init__(self, *args, **kwargs):
+        self.tasks = []
+
+    def route(self, *args, **kwargs):
+        return lambda f: f
+
+    def clear_cache(self):
+        pass
+
+    def add_task_to_user(self, task_id, task_name, user, result_type):
+        self.tasks.append(task_id)
+
+    def has_role(self, role, user):
+        return True
+
+
+class AsyncResult:
+    def __init__(self, value):
+        self.id = uuid.uuid4().hex
+        self.result = value
+
+    def get(self, *args, **kwargs):
+        return self.result
+
+
+class Signature:
+    def __init__(self, task, args, kwargs):
+        self.task = task
+        self.args = args
+        self.kwargs = kwargs
+        self.errbacks = []
+
+    def __call__(self, *extra):
+        return self.task(*(extra + self.args), **self.kwargs)
+
+    def set(self, **options):
+        return self
+
+    def on_error(self, errback):
+        self.errbacks.append(errback)
+        return errback
+
+
+class Task:
+    # tarea de Celery que se ejecuta de inmediato en el mismo proceso
+    def __init__(self, fn, bind=False, name=None, **options):
+        self.fn = fn
+        self.bind = bind
+        self.name = name
+        self.options = options
+        self.request = types.SimpleNamespace(id=None)
+        self.states = []
+
+    def __call__(self, *args, **kwargs):
+        self.request.id = uuid.uuid4().hex
+        if self.bind:
+            return self.fn(self, *args, **kwargs)
+        return self.fn(*args, **kwargs)
+
+    def s(self, *args, **kwargs):
+        return Signature(self, args, kwargs)
+
+    def delay(self, *args, **kwargs):
+        return AsyncResult(self(*args, **kwargs))
+
+    def apply_async(self, args=(), kwargs=None, **options):
+        return AsyncResult(self(*args, **(kwargs or {})))
+
+    def update_state(self, task_id=None, state=None, meta=None):
+        self.states.append((state, meta))
+
+
+def shared_task(*args, **options):
+    if len(args) == 1 and callable(args[0]):
+        return Task(args[0])
+    return lambda fn: Task(fn, **options)
+
+
+# los chords se ejecutan en orden cuando termina el que está en curso, así un
+# chord que despacha otros desde su callback no los anida
+_chords = collections.deque()
+_running = []
+
+
+def _run_chord(header, callback):
+    try:
+        callback([s() for s in header])
+    except Exception as e:
+        if len(callback.errbacks) == 0:
+            raise
+        for errback in callback.errbacks:
+            errback(types.SimpleNamespace(id=None), e, None)
+
+
+def chord(header):
+    def run(callback):
+        _chords.append((header, callback))
+        if len(_running) == 0:
+            _running.append(True)
+            try:
+                while len(_chords) > 0:
+                    _run_chord(*_chords.popleft())
+            finally:
+                _running.clear()
+                _chords.clear()
+        return AsyncResult(None)
+    return run
+
+
+class Signal:
+    def connect(self, fn=None, **kwargs):
+        return fn if fn is not None else (lambda f: f)
+
+
+def _module(name, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    sys.modules[name] = module
+    return module
+
+
+def _available(name):
+    try:
+        importlib.import_module(name)
+        return True
+    except ImportError:
+        return False
+
+
+def install():
+    _module('app')
+    _module('app.utils', DatabaseHandler=_module('app.utils.DatabaseHandler', DatabaseHandler=DatabaseHandler))
+    _module('app.utils.PluginClass', PluginClass=PluginClass)
+    for name in ('app.api', 'app.api.records', 'app.api.resources', 'app.api.users', 'app.api.tasks'):
+        _module(name)
+    _module('app.api.records.models', RecordUpdate=dict)
+    _module('app.api.resources.services', update_cache=lambda *a, **k: None)
+    _module('app.api.records.services', update_cache=lambda *a, **k: None)
+    _module('app.api.users.services', has_role=lambda *a, **k: True)
+    _module('app.api.tasks.services', add_task=lambda *a, **k: None)
+
+    _module('celery', shared_task=shared_task, chord=chord, group=list)
+    _module('celery.signals', worker_process_init=Signal())
+    _module('pymongo', UpdateOne=UpdateOne, ReturnDocument=ReturnDocument)
+
+    if not _available('flask'):
+        _module('flask', request=None)
+    if not _available('flask_jwt_extended'):
+        _module('flask_jwt_extended', jwt_required=lambda *a, **k: (lambda f: f), get_jwt_identity=lambda: 'bench')
+    if not _available('dotenv'):
+        _module('dotenv', load_dotenv=lambda *a, **k: None)
+    if not _available('bson'):
+        _module('bson')
+        _module('bson.objectid', ObjectId=lambda oid=None: oid if oid is not None else uuid.uuid4().hex[:24])
+        _module('bson.binary', Binary=bytes)
@@ -0,0 +1,75 @@
+# Documentos sintéticos para los benchmarks: un PDF (con o sin capa de texto)
+# y las imágenes web/big de cada página con el mismo texto dibujado.
+import os
+import random
+
+WORDS = ['archivo', 'documento', 'expediente', 'registro', 'informe', 'oficio', 'acta', 'señor',
+         'ministerio', 'república', 'bogotá', 'enero', 'folio', 'carta', 'asunto', 'fecha']
+
+
+def synthetic_lines(n_lines, page_w, page_h, seed):
+    rnd = random.Random(seed)
+    lines = []
+    y = page_h - 72
+    for _ in range(n_lines):
+        if y < 72:
+            break
+        text = ' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(4, 10)))
+        lines.append((72, y, text))
+        y -= 16
+    return lines
+
+
+def write_pdf(path, pages, page_w=612, page_h=792):
+    # PDF mínimo con una fuente Type1 estándar; una página sin líneas queda
+    # sin capa de texto
+    out = [b'%PDF-1.4\n']
+    offsets = {}
+
+    def add(num, body):
+        offsets[num] = sum(len(x) for x in out)
+        out.append(b'%d 0 obj\n' % num + body + b'\nendobj\n')
+
+    kids = [4 + i * 2 for i in range(len(pages))]
+    add(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+    add(2, b'<< /Type /Pages /Kids [' + b' '.join(b'%d 0 R' % k for k in kids) + b'] /Count %d >>' % len(pages))
+    add(3, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+
+    for i, lines in enumerate(pages):
+        stream = b''.join(b'BT /F1 12 Tf %d %d Td (%s) Tj ET\n' % (x, y, text.encode('cp1252')) for x, y, text in lines)
+        add(kids[i], b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>' % (page_w, page_h, kids[i] + 1))
+        add(kids[i] + 1, b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'endstream')
+
+    size = 4 + len(pages) * 2
+    xref = sum(len(x) for x in out)
+    out.append(b'xref\n0 %d\n0000000000 65535 f \n' % size)
+    out.extend(b'%010d 00000 n \n' % offsets[i] for i in range(1, size))
+    out.append(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (size, xref))
+
+    with open(path, 'wb') as f:
+        f.write(b''.join(out))
+
+
+def write_page_image(path, lines, page_w=612, page_h=792, dpi=200):
+    import cv2
+    import numpy as np
+
+    scale = dpi / 72
+    image = np.full((int(page_h * scale), int(page_w * scale), 3), 255, dtype=np.uint8)
+    for x, y, text in lines:
+        # el texto se dibuja en la misma posición que en el PDF
+        cv2.putText(image, text.encode('ascii', 'replace').decode('ascii'), (int(x * scale), int((page_h - y) * scale)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 0), 2, cv2.LINE_AA)
+    cv2.imwrite(path, image, [cv2.IMWRITE_JPEG_QUALITY, 85])
+
+
+def make_document(web_root, original_root, name, n_pages, text_layer=True, n_lines=40, dpi=200, seed=0):
+    # crea <original_root>/<name>.pdf y <web_root>/<name>/web/big/NNNN.jpg
+    big = os.path.join(web_root, name, 'web', 'big')
+    os.makedirs(big, exist_ok=True)
+    os.makedirs(os.path.dirname(os.path.join(original_root, name)), exist_ok=True)
+
+    pages = [synthetic_lines(n_lines, 612, 792, seed * 10000 + i) for i in range(n_pages)]
+    write_pdf(os.path.join(original_root, name + '.pdf'), pages if text_layer else [[] for _ in pages])
+    for i, lines in enumerate(pages):
+        write_page_image(os.path.join(big, '%04d.jpg' % (i + 1)), lines, dpi=dpi)
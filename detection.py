@@ -0,0 +1,57 @@
+import os
+
+# tamaño máximo de los lotes de páginas que se detectan en una sola pasada
+DETECTION_BATCH_SIZE = int(os.environ.get('OCR_DETECTION_BATCH_SIZE', 4))
+# memoria máxima de las imágenes decodificadas que se acumulan en un lote
+DETECTION_BATCH_MEMORY = int(os.environ.get('OCR_DETECTION_BATCH_MEMORY_MB', 512)) * 1024 * 1024
+# hilos intra-op de torch; por defecto se deja el valor de torch
+TORCH_THREADS = int(os.environ.get('OCR_TORCH_THREADS', 0))
+
+
+def batched(items, size, max_bytes, size_fn):
+    # agrupa los elementos en lotes de hasta `size` elementos y `max_bytes`
+    # bytes; un elemento más grande que el presupuesto va solo en su lote
+    batch = []
+    batch_bytes = 0
+    for item in items:
+        item_bytes = size_fn(item)
+        if batch and (len(batch) >= size or batch_bytes + item_bytes > max_bytes):
+            yield batch
+            batch = []
+            batch_bytes = 0
+        batch.append(item)
+        batch_bytes += item_bytes
+    if batch:
+        yield batch
+
+
+def detect_batch(model, images):
+    # ejecuta el predictor de detectron2 de un Detectron2LayoutModel sobre
+    # varias imágenes a la vez y devuelve un lp.Layout por imagen
+    predictor = getattr(model, 'model', None)
+    if not hasattr(predictor, 'aug'):
+        return [model.detect(image) for image in images]
+
+    import torch
+
+    if TORCH_THREADS > 0 and torch.get_num_threads() != TORCH_THREADS:
+        torch.set_num_threads(TORCH_THREADS)
+
+    # mismo preprocesamiento que DefaultPredictor.__call__, imagen por imagen
+    inputs = []
+    for image in images:
+        image = model.image_loader(image)
+        if predictor.input_format == 'RGB':
+            image = image[:, :, ::-1]
+        height, width = image.shape[:2]
+        transformed = predictor.aug.get_transform(image).apply_image(image)
+        inputs.append({
+            'image': torch.as_tensor(transformed.astype('float32').transpose(2, 0, 1)),
+            'height': height,
+            'width': width
+        })
+
+    with torch.no_grad():
+        outputs = predictor.model(inputs)
+
+    return [model.gather_output(o) for o in outputs]
@@ -0,0 +1,194 @@
+import os
+import re
+import bisect
+import heapq
+import time
+import threading
+from contextlib import contextmanager
+
+# archivo de texto en formato Prometheus (textfile collector de node_exporter)
+OCR_METRICS_TEXTFILE = os.environ.get('OCR_METRICS_TEXTFILE', '')
+
+STAGES = ['cache', 'text_layer', 'decode', 'detect', 'ocr', 'db_write']
+# límites en segundos del histograma de tiempo por página de cada etapa
+PAGE_SECONDS_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+# páginas más lentas que conserva el resumen con su detalle por etapa
+OCR_METRICS_SLOWEST_PAGES = int(os.environ.get('OCR_METRICS_SLOWEST_PAGES', 10))
+COUNTERS = ['pages', 'blocks', 'ocr_blocks', 'ocr_dedup_hits', 'ocr_dedup_misses', 'ocr_skipped', 'words', 'cache_hits']
+
+
+class PipelineMetrics:
+    # Tiempos por etapa, en total y por página, y contadores del pipeline
+    def __init__(self):
+        self.stages = {}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.pages = {}
+        # las etapas de lectura corren en otros hilos
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, page=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, page)
+
+    def add(self, name, seconds, page=None):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0) + seconds
+            if page is not None:
+                stages = self.pages.setdefault(page, {})
+                stages[name] = stages.get(name, 0) + seconds
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def to_dict(self):
+        return {
+            'stages': self.stages,
+            'counters': self.counters,
+            'pages': [{'page': page, 'stages': stages} for page, stages in sorted(self.pages.items())]
+        }
+
+
+def _percentile(stage, q):
+    # estima el percentil interpolando dentro del intervalo del histograma
+    rank = q * stage['count']
+    seen = 0
+    lower = 0
+    for upper, n in zip(PAGE_SECONDS_BUCKETS + [stage['max']], stage['buckets']):
+        if n > 0 and seen + n >= rank:
+            upper = min(upper, stage['max'])
+            return lower + (upper - lower) * (rank - seen) / n
+        seen += n
+        lower = upper
+    return stage['max']
+
+
+def merge_metrics(items):
+    # suma las métricas de varias subtareas o de resúmenes anteriores. Del
+    # detalle por página quedan las páginas más lentas y, por etapa, un
+    # histograma del tiempo por página con sus percentiles
+    stages = {}
+    counters = dict.fromkeys(COUNTERS, 0)
+    page_stages = {}
+    pages = []
+
+    def page_stage(name):
+        return page_stages.setdefault(name, {'count': 0, 'sum': 0, 'max': 0, 'buckets': [0] * (len(PAGE_SECONDS_BUCKETS) + 1)})
+
+    for item in items:
+        for name, seconds in item['stages'].items():
+            stages[name] = stages.get(name, 0) + seconds
+        for name, n in item['counters'].items():
+            counters[name] = counters.get(name, 0) + n
+        # las páginas más lentas se recortan sobre la marcha para que el
+        # resumen de un trabajo grande no crezca con cada registro
+        if len(pages) > 2 * OCR_METRICS_SLOWEST_PAGES:
+            pages = heapq.nlargest(OCR_METRICS_SLOWEST_PAGES, pages, key=lambda p: p['seconds'])
+        for page in item.get('pages', []):
+            pages.append({**page, 'seconds': sum(page['stages'].values())})
+            if 'page_stages' in item:
+                continue
+            for name, seconds in page['stages'].items():
+                stage = page_stage(name)
+                stage['count'] += 1
+                stage['sum'] += seconds
+                stage['max'] = max(stage['max'], seconds)
+                stage['buckets'][bisect.bisect_left(PAGE_SECONDS_BUCKETS, seconds)] += 1
+        for name, other in item.get('page_stages', {}).items():
+            stage = page_stage(name)
+            stage['count'] += other['count']
+            stage['sum'] += other['sum']
+            stage['max'] = max(stage['max'], other['max'])
+            stage['buckets'] = [a + b for a, b in zip(stage['buckets'], other['buckets'])]
+
+    for stage in page_stages.values():
+        stage['p50'] = _percentile(stage, 0.5)
+        stage['p95'] = _percentile(stage, 0.95)
+
+    summary = {
+        'stages': stages,
+        'counters': counters,
+        'page_stages': page_stages,
+        'pages': heapq.nlargest(OCR_METRICS_SLOWEST_PAGES, pages, key=lambda p: p['seconds'])
+    }
+    # fracción de los recortes enviados a OCR que reutilizaron un texto ya
+    # reconocido; en Prometheus sale de ocrprocessing_ocr_dedup_*_total
+    lookups = counters['ocr_dedup_hits'] + counters['ocr_dedup_misses']
+    if lookups > 0:
+        summary['ocr_dedup_hit_rate'] = counters['ocr_dedup_hits'] / lookups
+    return summary
+
+
+def progress_meta(done, total, started):
+    elapsed = time.time() - started
+    eta = elapsed / done * (total - done) if done > 0 else None
+    return {'done': done, 'total': total, 'elapsed': elapsed, 'eta': eta}
+
+
+def export_prometheus(summary, path=OCR_METRICS_TEXTFILE):
+    # acumula el resumen de un trabajo en el archivo de métricas
+    if not path:
+        return
+
+    import fcntl
+
+    with open(path + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        values = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    match = re.match(r'^(\S+) (\S+)$', line.strip())
+                    if match:
+                        values[match.group(1)] = float(match.group(2))
+
+        def inc(key, n):
+            values[key] = values.get(key, 0) + n
+
+        inc('ocrprocessing_jobs_total', 1)
+        inc('ocrprocessing_job_seconds_total', summary['seconds'])
+        for name, n in summary['counters'].items():
+            inc(f'ocrprocessing_{name}_total', n)
+        for name, seconds in summary['stages'].items():
+            inc(f'ocrprocessing_stage_seconds_total{{stage="{name}"}}', seconds)
+        for name, stage in summary.get('page_stages', {}).items():
+            cumulative = 0
+            for le, n in zip(PAGE_SECONDS_BUCKETS + ['+Inf'], stage['buckets']):
+                cumulative += n
+                inc(f'ocrprocessing_page_stage_seconds_bucket{{stage="{name}",le="{le}"}}', cumulative)
+            inc(f'ocrprocessing_page_stage_seconds_sum{{stage="{name}"}}', stage['sum'])
+            inc(f'ocrprocessing_page_stage_seconds_count{{stage="{name}"}}', stage['count'])
+
+        lines = [
+            '# HELP ocrprocessing_stage_seconds_total Tiempo acumulado por etapa del pipeline.',
+            '# TYPE ocrprocessing_stage_seconds_total counter'
+        ]
+        lines += [f'{key} {value}' for key, value in sorted(values.items()) if key.startswith('ocrprocessing_stage_')]
+
+        # los intervalos de cada etapa van en orden creciente de `le`
+        def bucket_order(key):
+            match = re.match(r'^(.*),le="([^"]+)"\}$', key)
+            return (match.group(1), float(match.group(2))) if match else (key, 0)
+
+        lines += [
+            '# HELP ocrprocessing_page_stage_seconds Tiempo por página de cada etapa del pipeline.',
+            '# TYPE ocrprocessing_page_stage_seconds histogram'
+        ]
+        for stage in sorted({re.search(r'stage="([^"]+)"', key).group(1) for key in values if key.startswith('ocrprocessing_page_stage_')}):
+            keys = [key for key in values if key.startswith('ocrprocessing_page_stage_') and f'stage="{stage}"' in key]
+            buckets = sorted((key for key in keys if '_bucket' in key), key=bucket_order)
+            lines += [f'{key} {values[key]}' for key in buckets + sorted(key for key in keys if '_bucket' not in key)]
+
+        for key, value in sorted(values.items()):
+            if not key.startswith('ocrprocessing_stage_') and not key.startswith('ocrprocessing_page_stage_'):
+                lines += [f'# TYPE {key} counter', f'{key} {value}']
+
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp, path)
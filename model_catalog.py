@@ -0,0 +1,101 @@
+import os
+import threading
+from . import model_registry
+
+_catalog = None
+_lock = threading.Lock()
+
+
+def _label_map_path(name):
+    return os.path.join(model_registry.models_path, name, 'label_map.py')
+
+
+def _list_models():
+    models_path = model_registry.models_path
+    folders = [t for t in os.listdir(models_path) if os.path.isdir(os.path.join(models_path, t))]
+    return sorted(t for t in folders if t != '__pycache__')
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _ocr_types_block(label_maps):
+    condi_block = {
+        'type': 'condition',
+        'id': 'ocr_types',
+        'label': 'Tipos de segmentación para OCR',
+        'default': [],
+        'id_condition': 'model',
+        'condition': '==',
+        'options': [],
+    }
+    for folder, label_map in label_maps.items():
+        condi_block['options'].append({
+            'value': folder,
+            'fields': [
+                {
+                    'type': 'multiple-checkbox',
+                    'label': '',
+                    'id': folder + '_ocrtypes',
+                    'default': [],
+                    'required': False,
+                    'options': [{'label': label_map[key], 'value': label_map[key]} for key in label_map]
+                }
+            ]
+        })
+    return condi_block
+
+
+def _build(models):
+    label_maps = {}
+    for folder in models:
+        label_maps[folder] = model_registry.load_label_map(folder)
+
+    action_model_block = {
+        'type': 'select',
+        'id': 'model',
+        'label': 'Modelo de segmentación',
+        'default': '*',
+        'options': [{'value': '*', 'label': 'Detectar un único bloque en toda la página'}, {'value': 'existing', 'label': 'Usar los bloques guardados en el sistema'}] + [{'value': t, 'label': t} for t in models],
+    }
+    bulk_model_block = {
+        'type': 'select',
+        'id': 'model',
+        'label': 'Modelo de segmentación',
+        'default': '',
+        'options': [{'value': t, 'label': t} for t in models],
+        'required': True
+    }
+    condi_block = _ocr_types_block(label_maps)
+
+    return {
+        'models': models,
+        'label_maps': label_maps,
+        'action_blocks': [action_model_block, condi_block],
+        'bulk_blocks': [bulk_model_block, condi_block]
+    }
+
+
+def get_model_catalog():
+    # el catálogo de modelos y los bloques de formulario se construyen una
+    # vez y se reconstruyen solo si cambia el directorio de modelos o alguno
+    # de sus label_map.py
+    global _catalog
+
+    catalog = _catalog
+    if catalog is not None:
+        version = (_mtime(model_registry.models_path), tuple(_mtime(_label_map_path(m)) for m in catalog['models']))
+        if version == catalog['version']:
+            return catalog
+
+    with _lock:
+        models = _list_models()
+        version = (_mtime(model_registry.models_path), tuple(_mtime(_label_map_path(m)) for m in models))
+        if _catalog is None or _catalog['version'] != version:
+            _catalog = _build(models)
+            _catalog['version'] = version
+        return _catalog
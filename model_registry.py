@@ -0,0 +1,102 @@
+import os
+import sys
+import importlib
+import threading
+from collections import OrderedDict
+
+models_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+
+# límites del registro de modelos que vive en cada proceso del worker
+MODEL_CACHE_SIZE = int(os.environ.get('OCR_MODEL_CACHE_SIZE', 2))
+MODEL_CACHE_MEMORY = int(os.environ.get('OCR_MODEL_CACHE_MEMORY_MB', 4096)) * 1024 * 1024
+# modelos separados por comas que se cargan al iniciar el worker
+PRELOAD_MODELS = [m.strip() for m in os.environ.get('OCR_PRELOAD_MODELS', '').split(',') if m.strip()]
+
+MODEL_EXTRA_CONFIG = ["MODEL.ROI_HEADS.SCORE_THRESH_TEST", 0.7, "MODEL.ROI_BOX_HEAD.FED_LOSS_FREQ_WEIGHT_POWER", 0.5, "MODEL.DEVICE", "cpu"]
+
+_models = OrderedDict()
+_lock = threading.RLock()
+
+
+def _model_files(name):
+    folder = os.path.join(models_path, name)
+    return folder, [os.path.join(folder, f) for f in ('config.yaml', 'model.pth', 'label_map.py')]
+
+
+def model_version(name):
+    # la versión de un modelo es la fecha de modificación de sus archivos
+    _, files = _model_files(name)
+    return tuple(os.path.getmtime(f) for f in files)
+
+
+def load_label_map(name):
+    module_name = f'{__package__}.models.{name}.label_map'
+    if module_name in sys.modules:
+        module = importlib.reload(sys.modules[module_name])
+    else:
+        module = importlib.import_module(module_name)
+    return module.list_map[0]
+
+
+def _model_size(model, weights_path):
+    try:
+        return sum(p.numel() * p.element_size() for p in model.model.model.parameters())
+    except Exception:
+        return os.path.getsize(weights_path)
+
+
+def _load(name):
+    import layoutparser as lp
+
+    _, (config_path, weights_path, _) = _model_files(name)
+    label_map = load_label_map(name)
+    model = lp.Detectron2LayoutModel(config_path, weights_path,
+                                     extra_config=MODEL_EXTRA_CONFIG,
+                                     label_map=label_map, device='cpu')
+
+    return {
+        'model': model,
+        'label_map': label_map,
+        'size': _model_size(model, weights_path)
+    }
+
+
+def _evict():
+    total = sum(e['size'] for e in _models.values())
+    while len(_models) > 1 and (len(_models) > MODEL_CACHE_SIZE or total > MODEL_CACHE_MEMORY):
+        _, entry = _models.popitem(last=False)
+        total -= entry['size']
+
+
+def get_layout_model(name):
+    # devuelve (model, label_map) reutilizando el modelo si ya está cargado en
+    # el proceso y sus archivos no han cambiado desde que se cargó
+    key = (os.path.join(models_path, name), model_version(name))
+
+    with _lock:
+        entry = _models.get(key[0])
+        if entry is not None and entry['key'] == key:
+            _models.move_to_end(key[0])
+            return entry['model'], entry['label_map']
+
+        entry = _load(name)
+        entry['key'] = key
+        _models[key[0]] = entry
+        _models.move_to_end(key[0])
+        _evict()
+
+    return entry['model'], entry['label_map']
+
+
+def preload_models(names=None, warmup=True):
+    import numpy as np
+
+    for name in (names if names is not None else PRELOAD_MODELS):
+        try:
+            model, _ = get_layout_model(name)
+            if warmup:
+                # una primera inferencia sobre una imagen vacía inicializa los
+                # kernels y buffers de torch antes de la primera petición real
+                model.detect(np.zeros((64, 64, 3), dtype=np.uint8))
+        except Exception as e:
+            print(f'No se pudo precargar el modelo {name}: {str(e)}')
@@ -0,0 +1,167 @@
+import os
+import threading
+from collections import OrderedDict
+
+# número de recortes cuyo texto se recuerda en cada proceso del worker y
+# memoria que pueden ocupar sus imágenes; con 0 no se reutiliza el OCR
+OCR_DEDUP_CACHE_SIZE = int(os.environ.get('OCR_DEDUP_CACHE_SIZE', 10000))
+OCR_DEDUP_CACHE_MEMORY = int(os.environ.get('OCR_DEDUP_CACHE_MEMORY_MB', 256)) * 1024 * 1024
+# píxeles del recorte por celda del hash perceptual; la grilla crece con el
+# recorte para que textos distintos con la misma forma no coincidan
+DEDUP_HASH_CELL = 12
+DEDUP_HASH_MIN_CELLS = 16
+DEDUP_HASH_MAX_CELLS = 256
+# diferencia mínima entre píxeles vecinos para marcar un borde, así el ruido
+# de la compresión en zonas planas no cambia el hash
+DEDUP_HASH_MARGIN = 4
+# nivel de gris por debajo del cual un píxel se considera tinta
+DEDUP_INK_THRESHOLD = 128
+# fracción máxima de bits distintos para que un recorte guardado sea
+# candidato; con 0 solo se consideran los hashes idénticos
+OCR_DEDUP_MAX_DISTANCE = float(os.environ.get('OCR_DEDUP_MAX_DISTANCE', 0.1))
+# candidatos más cercanos por hash que se comparan píxel a píxel; el hash
+# apenas distingue un dígito de otro, así que deben ser varios
+DEDUP_MAX_CANDIDATES = 16
+# la comparación píxel a píxel alinea los recortes hasta este desplazamiento
+# y busca la ventana (del tamaño de un carácter) con más diferencia; un
+# nuevo escaneo del mismo texto queda cerca de 0.02 y un dígito distinto en
+# un pie de página pasa de 0.25
+DEDUP_CHECK_SHIFT = 2
+DEDUP_CHECK_WINDOW = 16
+DEDUP_CHECK_MAX_DIFF = 0.1
+
+
+def block_signature(image):
+    # firma de un recorte: el recorte en grises ajustado al área con tinta y
+    # un dHash suyo, que sirve para encontrar candidatos. Ajustar a la tinta
+    # lo hace independiente de dónde cayó la caja del bloque.
+    import numpy as np
+
+    # el canal verde basta como gris y evita copiar la imagen completa
+    gray = image[..., 1] if image.ndim == 3 else image
+    ink = gray < DEDUP_INK_THRESHOLD
+    rows_ink = np.flatnonzero(ink.any(axis=1))
+    cols_ink = np.flatnonzero(ink.any(axis=0))
+    if len(rows_ink) == 0:
+        return None
+    gray = np.ascontiguousarray(gray[rows_ink[0]:rows_ink[-1] + 1, cols_ink[0]:cols_ink[-1] + 1])
+
+    height, width = gray.shape
+    shape = tuple(int(min(max(round(n / DEDUP_HASH_CELL), DEDUP_HASH_MIN_CELLS), DEDUP_HASH_MAX_CELLS)) for n in (height, width))
+    return shape, dhash(gray, shape), gray
+
+
+def dhash(gray, shape):
+    import cv2
+    import numpy as np
+
+    rows, cols = shape
+    small = cv2.resize(gray, (cols + 1, rows), interpolation=cv2.INTER_AREA).astype(np.int16)
+    bits = (small[:, :-1] - small[:, 1:]) > DEDUP_HASH_MARGIN
+    return np.packbits(bits).tobytes()
+
+
+def _best_shift(a, b, r):
+    # desplazamiento de `a` (ya rodeado de r píxeles) que mejor alinea sus
+    # perfiles de tinta con los de `b`
+    return min(range(-r, r + 1), key=lambda d: float(abs(a[r + d:r + d + len(b)] - b).sum()))
+
+
+def same_ink(a, b):
+    # compara dos recortes ajustados a la tinta: se alinean con un
+    # desplazamiento pequeño y ninguna ventana del tamaño de un carácter
+    # puede diferir más de DEDUP_CHECK_MAX_DIFF
+    import cv2
+    import numpy as np
+
+    r = DEDUP_CHECK_SHIFT
+    if abs(a.shape[0] - b.shape[0]) > r or abs(a.shape[1] - b.shape[1]) > r:
+        return False
+
+    # el recorte guardado se rodea de blanco para poder desplazarlo
+    pad = [(r, r + max(b.shape[i] - a.shape[i], 0)) for i in (0, 1)]
+    padded = np.pad(a, pad, constant_values=255)
+    ink_a, ink_b = 255 - padded.astype(np.int32), 255 - b.astype(np.int32)
+    dy = _best_shift(ink_a.sum(axis=1), ink_b.sum(axis=1), r)
+    dx = _best_shift(ink_a.sum(axis=0), ink_b.sum(axis=0), r)
+    diff = cv2.absdiff(padded[r + dy:r + dy + b.shape[0], r + dx:r + dx + b.shape[1]], b)
+    return float(cv2.blur(diff, (DEDUP_CHECK_WINDOW, DEDUP_CHECK_WINDOW)).max()) <= DEDUP_CHECK_MAX_DIFF * 255
+
+
+class OCRDedupCache:
+    # LRU con el texto de los recortes ya reconocidos. Las entradas van por
+    # ámbito (el trabajo o el registro) para que solo se compartan entre los
+    # registros de un mismo trabajo, y se agrupan por tamaño de grilla. El
+    # hash solo propone candidatos: el texto se reutiliza si el recorte
+    # también coincide píxel a píxel.
+    def __init__(self, size=OCR_DEDUP_CACHE_SIZE, memory=OCR_DEDUP_CACHE_MEMORY, max_distance=OCR_DEDUP_MAX_DISTANCE):
+        self.size = size
+        self.memory = memory
+        self.max_distance = max_distance
+        # textos distintos pueden compartir hash, así que cada entrada tiene
+        # su propio número y el grupo guarda el hash de cada una
+        self._entries = OrderedDict()
+        self._buckets = {}
+        self._next = 0
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _candidates(self, bucket, shape, bits):
+        import numpy as np
+
+        ids = list(bucket)
+        stored = np.frombuffer(b''.join(bucket.values()), dtype=np.uint8).reshape(len(ids), -1)
+        distances = np.unpackbits(stored ^ np.frombuffer(bits, dtype=np.uint8), axis=1).sum(axis=1)
+        for i in np.argsort(distances, kind='stable')[:DEDUP_MAX_CANDIDATES]:
+            if distances[i] > self.max_distance * shape[0] * shape[1]:
+                return
+            yield ids[i]
+
+    def get(self, scope, signature):
+        if self.size <= 0 or signature is None:
+            return None
+        shape, bits, ink = signature
+        with self._lock:
+            # un píxel más o menos de tinta puede cambiar el tamaño de la
+            # grilla, así que también se buscan las grillas vecinas
+            for dr in (0, -1, 1):
+                for dc in (0, -1, 1):
+                    near = (shape[0] + dr, shape[1] + dc)
+                    bucket = self._buckets.get((scope, near))
+                    if bucket is None:
+                        continue
+                    for entry in self._candidates(bucket, near, bits if near == shape else dhash(ink, near)):
+                        text, stored_ink = self._entries[entry][1:]
+                        if same_ink(stored_ink, ink):
+                            self._entries.move_to_end(entry)
+                            return text
+        return None
+
+    def set(self, scope, signature, text):
+        if self.size <= 0 or signature is None:
+            return
+        shape, bits, ink = signature
+        with self._lock:
+            self._next += 1
+            self._entries[self._next] = ((scope, shape), text, ink)
+            self._buckets.setdefault((scope, shape), {})[self._next] = bits
+            self._bytes += ink.nbytes
+            while len(self._entries) > 0 and (len(self._entries) > self.size or self._bytes > self.memory):
+                entry, (group, _, old_ink) = self._entries.popitem(last=False)
+                self._bytes -= old_ink.nbytes
+                bucket = self._buckets[group]
+                del bucket[entry]
+                if len(bucket) == 0:
+                    del self._buckets[group]
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_ocr_dedup_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = OCRDedupCache()
+    return _cache
@@ -0,0 +1,75 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+tessdata_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tessdata')
+
+# número de instancias de Tesseract que mantiene cada proceso del worker; con
+# prefork ya hay un proceso por cada tarea concurrente, así que por defecto
+# es 1 para no tener concurrencia × CPUs hilos de Tesseract
+OCR_POOL_SIZE = int(os.environ.get('OCR_POOL_SIZE', 1))
+OCR_LANGUAGES = os.environ.get('OCR_LANGUAGES', 'spa')
+
+
+class TesseractPool:
+    # Pool de hilos donde cada hilo mantiene su propia instancia de Tesseract
+    # con los traineddata cargados. Con tesserocr el reconocimiento se hace
+    # en memoria y sin crear procesos; si no está instalado se usa pytesseract.
+    def __init__(self, size=OCR_POOL_SIZE, languages=OCR_LANGUAGES):
+        self.size = size
+        self.languages = languages
+        self.tessdata = tessdata_path if self._has_tessdata() else None
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='tesseract')
+        self._local = threading.local()
+
+        try:
+            import tesserocr
+            self._backend = 'tesserocr'
+        except ImportError:
+            self._backend = 'pytesseract'
+            print('tesserocr no está instalado: el OCR usa pytesseract, que inicia un proceso de tesseract por cada bloque')
+
+    def _has_tessdata(self):
+        return all(os.path.exists(os.path.join(tessdata_path, lang + '.traineddata')) for lang in self.languages.split('+'))
+
+    def _api(self):
+        api = getattr(self._local, 'api', None)
+        if api is None:
+            import tesserocr
+            if self.tessdata:
+                api = tesserocr.PyTessBaseAPI(path=self.tessdata, lang=self.languages)
+            else:
+                api = tesserocr.PyTessBaseAPI(lang=self.languages)
+            self._local.api = api
+        return api
+
+    def _ocr(self, image):
+        import numpy as np
+        from PIL import Image
+
+        image = Image.fromarray(np.ascontiguousarray(image))
+
+        if self._backend == 'tesserocr':
+            api = self._api()
+            api.SetImage(image)
+            return api.GetUTF8Text()
+
+        import pytesseract
+        config = f'--tessdata-dir {self.tessdata}' if self.tessdata else ''
+        return pytesseract.image_to_string(image, lang=self.languages, config=config)
+
+    def map(self, images):
+        # los resultados se devuelven en el mismo orden que las imágenes
+        return list(self.executor.map(self._ocr, images))
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_ocr_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = TesseractPool()
+    return _pool
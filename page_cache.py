@@ -0,0 +1,163 @@
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime
+
+plugin_path = os.path.dirname(os.path.abspath(__file__))
+
+# almacenamiento de los resultados por página: 'disk', 'mongo' o 'none'
+OCR_CACHE_BACKEND = os.environ.get('OCR_CACHE_BACKEND', 'disk')
+OCR_CACHE_PATH = os.environ.get('OCR_CACHE_PATH', os.path.join(plugin_path, 'cache'))
+OCR_CACHE_COLLECTION = os.environ.get('OCR_CACHE_COLLECTION', 'ocrProcessing_cache')
+OCR_CACHE_MAX_MB = int(os.environ.get('OCR_CACHE_MAX_MB', 2048))
+
+
+def file_stat(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def page_cache_key(image_path, pdf_path, page, model, model_version, ocr_types, result_format='full', settings=None):
+    # la clave depende de la imagen de la página, de la página del PDF
+    # original, del modelo y sus pesos, de los tipos que van a OCR y de los
+    # ajustes que cambian el resultado. De los archivos basta con el tamaño
+    # y la fecha de modificación: se reescriben cuando el documento se vuelve
+    # a procesar y leer la imagen completa en cada página costaba más que
+    # muchas de las páginas que se encuentran en la caché.
+    parts = {
+        'image': file_stat(image_path),
+        'pdf': file_stat(pdf_path) + [page] if os.path.exists(pdf_path) else None,
+        'model': model,
+        'model_version': list(model_version),
+        'ocr_types': sorted(ocr_types)
+    }
+    if settings:
+        parts['settings'] = settings
+    # el formato por defecto no entra en la clave para conservar las entradas
+    # que ya estaban en la caché
+    if result_format != 'full':
+        parts['result_format'] = result_format
+    return hashlib.sha1(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class NullPageCache:
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+
+class DiskPageCache:
+    # Un archivo JSON por página. La fecha de modificación se actualiza en
+    # cada acierto y se usa para expulsar primero lo menos usado.
+    def __init__(self, root=OCR_CACHE_PATH, max_bytes=OCR_CACHE_MAX_MB * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key + '.json')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+            os.utime(path)
+            return value
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # escritura atómica para que una tarea interrumpida no deje entradas a medias
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(value, f)
+        os.replace(tmp, path)
+
+        with self._lock:
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self.evict()
+
+    def evict(self):
+        entries = []
+        for root, _, files in os.walk(self.root):
+            for name in files:
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(e[1] for e in entries)
+        if total <= self.max_bytes:
+            return
+
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            if total <= self.max_bytes * 0.9:
+                break
+
+
+class MongoPageCache:
+    def __init__(self, collection, max_bytes=OCR_CACHE_MAX_MB * 1024 * 1024):
+        self.collection = collection
+        self.max_bytes = max_bytes
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        doc = self.collection.find_one_and_update({'_id': key}, {'$set': {'usedAt': datetime.now()}})
+        return doc['value'] if doc else None
+
+    def set(self, key, value):
+        size = len(json.dumps(value))
+        self.collection.replace_one({'_id': key}, {'value': value, 'size': size, 'usedAt': datetime.now()}, upsert=True)
+
+        with self._lock:
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self.evict()
+
+    def evict(self):
+        total = next(self.collection.aggregate([{'$group': {'_id': None, 'size': {'$sum': '$size'}}}]), {'size': 0})['size']
+        if total <= self.max_bytes:
+            return
+
+        remove = []
+        for doc in self.collection.find({}, {'size': 1}).sort('usedAt', 1):
+            remove.append(doc['_id'])
+            total -= doc['size']
+            if total <= self.max_bytes * 0.9:
+                break
+        self.collection.delete_many({'_id': {'$in': remove}})
+
+
+_cache = None
+
+
+def get_page_cache():
+    global _cache
+    if _cache is None:
+        if OCR_CACHE_BACKEND == 'mongo':
+            from app.utils import DatabaseHandler
+            _cache = MongoPageCache(DatabaseHandler.DatabaseHandler().db[OCR_CACHE_COLLECTION])
+        elif OCR_CACHE_BACKEND == 'disk':
+            _cache = DiskPageCache()
+        else:
+            _cache = NullPageCache()
+    return _cache
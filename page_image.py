@@ -0,0 +1,62 @@
+import os
+
+# lado menor y lado mayor con los que detectron2 redimensiona la imagen si
+# el modelo no trae los valores en su configuración
+DETECTION_MIN_SIZE = int(os.environ.get('OCR_DETECTION_MIN_SIZE', 800))
+DETECTION_MAX_SIZE = int(os.environ.get('OCR_DETECTION_MAX_SIZE', 1333))
+
+
+def detection_sizes(model):
+    cfg = getattr(model, 'cfg', None)
+    try:
+        min_size = cfg.INPUT.MIN_SIZE_TEST
+        max_size = cfg.INPUT.MAX_SIZE_TEST
+    except AttributeError:
+        return DETECTION_MIN_SIZE, DETECTION_MAX_SIZE
+    return min_size, max_size
+
+
+class PageImage:
+    # Imagen de una página que se lee solo cuando hace falta: el tamaño sale
+    # de la cabecera del archivo, la detección usa una decodificación reducida
+    # y la imagen completa solo se decodifica si algún bloque va a OCR.
+    def __init__(self, path):
+        from PIL import Image
+
+        self.path = path
+        with Image.open(path) as im:
+            self.width, self.height = im.size
+            # cv2 aplica la orientación EXIF al decodificar
+            if im.getexif().get(0x0112) in (5, 6, 7, 8):
+                self.width, self.height = self.height, self.width
+        self._full = None
+
+    def full(self):
+        import cv2
+
+        if self._full is None:
+            self._full = cv2.imread(self.path)[..., ::-1]
+        return self._full
+
+    def reduction(self, min_size, max_size):
+        # mayor factor de reducción que no baja la imagen por debajo del tamaño
+        # al que la va a llevar el modelo
+        short, long = min(self.width, self.height), max(self.width, self.height)
+        scale = min(min_size / short, max_size / long)
+        for factor in (8, 4, 2):
+            if factor * scale <= 1:
+                return factor
+        return 1
+
+    def reduced(self, min_size, max_size):
+        import cv2
+
+        factor = self.reduction(min_size, max_size)
+        if factor == 1:
+            return self.full()
+
+        flags = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+        return cv2.imread(self.path, flags[factor])[..., ::-1]
+
+    def release(self):
+        self._full = None
@@ -0,0 +1,446 @@
+import os
+import re
+import time
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from .text_layer import iter_text_layer
+from .word_index import WordIndex
+from .model_registry import get_layout_model, load_label_map, model_version
+from .page_cache import get_page_cache, page_cache_key, NullPageCache
+from .ocr_pool import get_ocr_pool, OCR_LANGUAGES
+from .ocr_dedup import get_ocr_dedup_cache, block_signature
+from .page_image import PageImage, detection_sizes
+from .metrics import PipelineMetrics
+from .prefetch import prefetch, ordered_map, OCR_PREFETCH_PAGES, OCR_DECODE_THREADS
+from .result_storage import RESULT_FORMAT, compact_words
+from .detection import detect_batch, batched, DETECTION_BATCH_SIZE, DETECTION_BATCH_MEMORY
+
+WEB_FILES_PATH = os.environ.get('WEB_FILES_PATH', '')
+ORIGINAL_FILES_PATH = os.environ.get('ORIGINAL_FILES_PATH', '')
+# un bloque usa la capa de texto del PDF si sus palabras cubren al menos esta
+# fracción de su área y tienen esta cantidad de caracteres por pulgada
+# cuadrada; si no, va a OCR
+OCR_BLOCK_MIN_COVERAGE = float(os.environ.get('OCR_BLOCK_MIN_COVERAGE', 0.02))
+OCR_BLOCK_MIN_CHAR_DENSITY = float(os.environ.get('OCR_BLOCK_MIN_CHAR_DENSITY', 1))
+# los bloques con un lado menor a estos píxeles o con menos de esta fracción
+# de tinta no se envían a OCR
+OCR_BLOCK_MIN_SIZE = int(os.environ.get('OCR_BLOCK_MIN_SIZE', 10))
+OCR_BLOCK_MIN_INK = float(os.environ.get('OCR_BLOCK_MIN_INK', 0.002))
+INK_THRESHOLD = 128
+CID_PATTERN = re.compile(r'\(cid:\d+\)')
+
+
+def record_paths(record):
+    path = os.path.join(WEB_FILES_PATH, record['processing']['fileProcessing']['path'], 'web', 'big')
+    path_original = os.path.join(ORIGINAL_FILES_PATH, record['processing']['fileProcessing']['path'] + '.pdf')
+    return path, path_original
+
+
+# listados ordenados de web/big que se reutilizan mientras el directorio no
+# cambie, para ir directo al archivo de una página
+PAGE_FILES_CACHE_SIZE = 256
+_page_files = OrderedDict()
+_page_files_lock = threading.Lock()
+
+
+def page_files(path):
+    mtime = os.stat(path).st_mtime_ns
+    with _page_files_lock:
+        entry = _page_files.get(path)
+        if entry is not None and entry[0] == mtime:
+            _page_files.move_to_end(path)
+            return entry[1]
+
+    files = sorted(os.listdir(path))
+    with _page_files_lock:
+        _page_files[path] = (mtime, files)
+        _page_files.move_to_end(path)
+        while len(_page_files) > PAGE_FILES_CACHE_SIZE:
+            _page_files.popitem(last=False)
+    return files
+
+
+def count_pages(record):
+    path, _ = record_paths(record)
+    return len(page_files(path))
+
+
+def stored_processing(record):
+    # resultado guardado de un registro o None si todavía no se procesó
+    return (record or {}).get('processing', {}).get('ocrProcessing')
+
+
+def get_label_map(body, record=None):
+    if body.get('model', '*') == '*':
+        return {0: 'Page'}
+    if body['model'] == 'existing':
+        # en modo 'existing' se usan las etiquetas guardadas con los bloques
+        labels = (stored_processing(record) or {}).get('labels', {})
+        return {int(k): v for k, v in labels.items()}
+    return load_label_map(body['model'])
+
+
+def block_fingerprint(obj):
+    # huella del tipo y la caja de un bloque tal como quedaron al extraer su
+    # texto; si el editor los cambia la huella deja de coincidir
+    bbox = obj['bbox']
+    key = '%s:%.6f:%.6f:%.6f:%.6f' % (obj['type'], bbox['x'], bbox['y'], bbox['width'], bbox['height'])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+
+def process_record_pages(record, body, start=0, end=None, metrics=None, on_progress=None, scope=None):
+    # procesa las páginas [start, end) de un registro y devuelve su resultado
+    # en orden de página; on_progress recibe el número de páginas terminadas
+    # y scope es el ámbito en que se reutiliza el OCR de recortes repetidos
+    import layoutparser as lp
+
+    page_block = body.get('model', '*') == '*'
+    existing = body.get('model') == 'existing'
+    label_map = get_label_map(body, record)
+
+    if existing:
+        stored = {p['page']: p['blocks'] for p in (stored_processing(record) or {}).get('result', [])}
+        # los tipos pedidos se vuelven a extraer siempre; los demás bloques
+        # solo si cambiaron, y conservan texto los tipos que ya lo tenían
+        forced_types = body.get('ocr_types') or []
+        ocr_types = set(forced_types) | {b['type'] for blocks in stored.values() for b in blocks if 'text' in b}
+
+        def needs_update(obj):
+            return obj.get('fingerprint') != block_fingerprint(obj) or obj['type'] in forced_types \
+                or (obj['type'] in ocr_types and 'text' not in obj)
+    else:
+        ocr_types = body.get('ocr_types', list(label_map.values()))
+    ocr_pool = get_ocr_pool()
+    dedup_cache = get_ocr_dedup_cache()
+    scope = scope or str(record['_id'])
+    metrics = metrics if metrics is not None else PipelineMetrics()
+    on_progress = on_progress or (lambda n: None)
+
+    def process_page(page_data, layout, stored_blocks=None):
+        image_width = page_data['width']
+        image_height = page_data['height']
+        has_text = page_data['has_text']
+        words = page_data['words']
+        w_doc = page_data['w_doc']
+        h_doc = page_data['h_doc']
+
+        blocks = []
+        for l in label_map.values():
+            if existing:
+                break
+            if not page_block:
+                _ = lp.Layout([b for b in layout if b.type == l])
+                blocks.append(_)
+            else:
+                if l == 'Page':
+                    _ = lp.Layout([lp.TextBlock(lp.Rectangle(0, 0, image_width, image_height), type=l)])
+                    blocks.append(_)
+
+        resp_page = []
+
+        def segment_image(b, image):
+            segment_image = (
+                b.pad(left=5, right=5, top=5,
+                    bottom=5).crop_image(image)
+            )
+
+            return segment_image
+
+        def extract_segment_words(words, b):
+            segment_words = words.query_indices({
+                'x_1': (b.block.x_1 - 50) / image_width,
+                'y_1': (b.block.y_1 - 50) / image_height,
+                'x_2': (b.block.x_2 + 50) / image_width,
+                'y_2': (b.block.y_2 + 50) / image_height
+            })
+
+            return segment_words
+
+        def get_obj(b, txt, type, segment_words):
+            if RESULT_FORMAT == 'compact':
+                # textos y cajas de las palabras como columnas del bloque
+                if len(segment_words) > 0:
+                    x0, y0 = words.x0[segment_words], words.y0[segment_words]
+                    boxes = np.stack([x0, y0, words.x1[segment_words] - x0, words.y1[segment_words] - y0], axis=1)
+                else:
+                    boxes = np.empty((0, 4))
+                word_objs = compact_words([words.words[i]['text'] for i in segment_words], boxes)
+            else:
+                word_objs = [{
+                    'text': s['text'],
+                    'bbox': {
+                        'x': s['x0'] / w_doc,
+                        'y': s['top'] / h_doc,
+                        'width': (s['x1'] - s['x0']) / w_doc,
+                        'height': (s['bottom'] - s['top']) / h_doc
+                    }
+                } for s in (words.words[i] for i in segment_words)]
+
+            obj = {
+                'text': txt,
+                'type': type,
+                'bbox': {
+                    'x': b.block.x_1 / image_width,
+                    'y': b.block.y_1 / image_height,
+                    'width': (b.block.x_2 - b.block.x_1) / image_width,
+                    'height': (b.block.y_2 - b.block.y_1) / image_height
+                },
+                'words': word_objs
+            }
+            return obj
+
+        def full_image():
+            # en modo página completa con capa de texto la imagen solo se abre
+            # si la página termina yendo a OCR
+            if page_data['page_image'] is None:
+                page_data['page_image'] = PageImage(page_data['path'])
+            with metrics.stage('decode', page_data['page']):
+                return page_data['page_image'].full()
+
+        def image_box(b, image):
+            # caja del bloque en las coordenadas de una imagen de la página
+            sx = image.shape[1] / image_width
+            sy = image.shape[0] / image_height
+            return b.scale((sx, sy))
+
+        def text_layer_covers(b, segment_words):
+            # el bloque usa la capa de texto si sus palabras cubren una parte
+            # suficiente del bloque y tienen caracteres legibles; los
+            # marcadores (cid:N) de fuentes sin mapa de caracteres no cuentan
+            x_1, y_1 = b.block.x_1 / image_width, b.block.y_1 / image_height
+            x_2, y_2 = b.block.x_2 / image_width, b.block.y_2 / image_height
+            area = (x_2 - x_1) * (y_2 - y_1)
+            if len(segment_words) == 0 or area <= 0:
+                return False
+
+            iw = np.clip(np.minimum(words.x1[segment_words], x_2) - np.maximum(words.x0[segment_words], x_1), 0, None)
+            ih = np.clip(np.minimum(words.y1[segment_words], y_2) - np.maximum(words.y0[segment_words], y_1), 0, None)
+            coverage = float((iw * ih).sum()) / area
+
+            chars = sum(len(CID_PATTERN.sub('', words.words[i]['text'])) for i in segment_words)
+            density = chars / (area * w_doc * h_doc / 72 ** 2)
+
+            return coverage >= OCR_BLOCK_MIN_COVERAGE and density >= OCR_BLOCK_MIN_CHAR_DENSITY
+
+        def worth_ocr(b):
+            # los bloques muy pequeños o casi sin tinta no se envían a OCR; la
+            # tinta se mide en la imagen reducida de la detección si la hay
+            if min(b.block.x_2 - b.block.x_1, b.block.y_2 - b.block.y_1) < OCR_BLOCK_MIN_SIZE:
+                return False
+            image = page_data['image'] if page_data['image'] is not None else full_image()
+            crop = image_box(b, image).crop_image(image)
+            if crop.size == 0:
+                return False
+            return float((crop[..., 1] < INK_THRESHOLD).mean()) >= OCR_BLOCK_MIN_INK
+
+        # los recortes que necesitan OCR se envían juntos al pool de
+        # Tesseract y su texto se asigna después en el orden de los bloques
+        pending_ocr = []
+
+        def readable(i):
+            return len(CID_PATTERN.sub('', words.words[i]['text']).strip()) > 0
+
+        def build_block(b):
+            if b.type in ocr_types:
+                txt = ''
+                segment_words = []
+
+                if has_text:
+                    segment_words = [i for i in extract_segment_words(words, b) if readable(i)]
+
+                for i in segment_words:
+                    txt += words.words[i]['text'] + ' '
+                metrics.count('words', len(segment_words))
+                obj = get_obj(b, txt, b.type, segment_words)
+
+                # solo los bloques que la capa de texto no cubre van a OCR y
+                # conservan sus palabras legibles; el bloque de página
+                # completa no es una región detectada, así que si la página
+                # tiene palabras legibles se usan siempre
+                if len(segment_words) == 0 or not (page_block or text_layer_covers(b, segment_words)):
+                    if worth_ocr(b):
+                        # los recortes salen de la imagen a resolución completa
+                        full = full_image()
+                        pending_ocr.append((obj, segment_image(image_box(b, full), full)))
+                    else:
+                        metrics.count('ocr_skipped')
+            else:
+                obj = {
+                    'type': b.type,
+                    'bbox': {
+                        'x': b.block.x_1 / image_width,
+                        'y': b.block.y_1 / image_height,
+                        'width': (b.block.x_2 - b.block.x_1) / image_width,
+                        'height': (b.block.y_2 - b.block.y_1) / image_height
+                    }
+                }
+
+            obj['fingerprint'] = block_fingerprint(obj)
+            return obj
+
+        for block in blocks:
+            for b in block:
+                resp_page.append(build_block(b))
+
+        # en modo 'existing' los bloques guardados que no cambiaron se dejan
+        # tal cual y los demás se reconstruyen desde su caja normalizada
+        for obj in stored_blocks or []:
+            if needs_update(obj):
+                bbox = obj['bbox']
+                b = lp.TextBlock(lp.Rectangle(bbox['x'] * image_width, bbox['y'] * image_height,
+                                              (bbox['x'] + bbox['width']) * image_width,
+                                              (bbox['y'] + bbox['height']) * image_height), type=obj['type'])
+                obj = build_block(b)
+            resp_page.append(obj)
+
+        if len(pending_ocr) > 0:
+            with metrics.stage('ocr', page_data['page']):
+                # los recortes repetidos (membretes, sellos, pies de página)
+                # reutilizan el texto ya reconocido en el mismo trabajo
+                signatures = [block_signature(crop) for _, crop in pending_ocr]
+                texts = [dedup_cache.get(scope, s) for s in signatures]
+                todo = [i for i, txt in enumerate(texts) if txt is None]
+                results = ocr_pool.map([pending_ocr[i][1] for i in todo]) if len(todo) > 0 else []
+                for i, txt in zip(todo, results):
+                    dedup_cache.set(scope, signatures[i], txt)
+                    texts[i] = txt
+            for (obj, _), txt in zip(pending_ocr, texts):
+                obj['text'] = txt
+            metrics.count('ocr_dedup_hits', len(pending_ocr) - len(todo))
+            metrics.count('ocr_dedup_misses', len(todo))
+
+        metrics.count('blocks', len(resp_page))
+        metrics.count('ocr_blocks', len(pending_ocr))
+
+        if page_data['page_image'] is not None:
+            page_data['page_image'].release()
+
+        return {
+            'page': page_data['page'],
+            'blocks': resp_page
+        }
+
+    path, path_original = record_paths(record)
+    files = page_files(path)[start:end]
+    resp = {}
+
+    # las páginas que ya están en la caché no se vuelven a procesar; como cada
+    # página se guarda apenas termina, una tarea interrumpida retoma desde ahí
+    cache = get_page_cache() if not existing else NullPageCache()
+    use_cache = not isinstance(cache, NullPageCache)
+    version = model_version(body['model']) if not page_block and use_cache else ()
+    settings = {
+        'min_coverage': OCR_BLOCK_MIN_COVERAGE,
+        'min_char_density': OCR_BLOCK_MIN_CHAR_DENSITY,
+        'min_size': OCR_BLOCK_MIN_SIZE,
+        'min_ink': OCR_BLOCK_MIN_INK,
+        'languages': OCR_LANGUAGES
+    }
+    keys = {}
+    for i, f in enumerate(files):
+        page = start + i + 1
+        if existing:
+            # las páginas sin bloques por actualizar no se tocan
+            if not any(needs_update(b) for b in stored.get(page, [])):
+                resp[page] = {'page': page, 'blocks': stored.get(page, [])}
+            continue
+        if not use_cache:
+            continue
+
+        with metrics.stage('cache', page):
+            keys[page] = page_cache_key(os.path.join(path, f), path_original, page, body.get('model', '*'), version, ocr_types,
+                                        RESULT_FORMAT, settings)
+            cached = cache.get(keys[page])
+        if cached is not None:
+            resp[page] = {'page': page, 'blocks': cached}
+            metrics.count('cache_hits')
+
+    metrics.count('pages', len(resp))
+    if len(resp) > 0:
+        on_progress(len(resp))
+
+    missing = [(start + i + 1, f) for i, f in enumerate(files) if start + i + 1 not in resp]
+
+    # el PDF se abre una sola vez por rango y la capa de texto se consume
+    # página a página en el mismo orden que las imágenes
+    text_layer = iter_text_layer(path_original, pages=[page for page, _ in missing])
+
+    detect = not page_block and not existing
+    if detect and len(missing) > 0:
+        # el modelo se reutiliza entre tareas mientras siga cargado en el proceso
+        model, _ = get_layout_model(body['model'])
+        min_size, max_size = detection_sizes(model)
+
+    def read_text_layer():
+        try:
+            for page, _ in missing:
+                with metrics.stage('text_layer', page):
+                    _, has_text, words, w_doc, h_doc = next(text_layer, (page - 1, False, None, None, None))
+                    if has_text:
+                        words = WordIndex(words, w_doc, h_doc)
+                yield has_text, words, w_doc, h_doc
+        finally:
+            text_layer.close()
+
+    def load_page(item):
+        (page, f), (has_text, words, w_doc, h_doc) = item
+
+        page_image = None
+        image = None
+        if page_block and has_text:
+            # en modo página completa con capa de texto el único bloque es
+            # la página del PDF y no hace falta decodificar la imagen
+            width, height = w_doc, h_doc
+        else:
+            with metrics.stage('decode', page):
+                page_image = PageImage(os.path.join(path, f))
+                width, height = page_image.width, page_image.height
+                if detect:
+                    # la detección se hace sobre una decodificación reducida
+                    image = page_image.reduced(min_size, max_size)
+
+        return {
+            'page': page,
+            'path': os.path.join(path, f),
+            'image': image,
+            'page_image': page_image,
+            'width': width,
+            'height': height,
+            'has_text': has_text,
+            'words': words,
+            'w_doc': w_doc,
+            'h_doc': h_doc
+        }
+
+    # la capa de texto se lee en su propio hilo y las imágenes se decodifican
+    # en otros mientras este hilo detecta y hace OCR; las colas acotadas
+    # limitan las páginas en memoria y el orden de las páginas se conserva
+    text_layers = prefetch(read_text_layer(), OCR_PREFETCH_PAGES, 'text-layer')
+    pages = ordered_map(load_page, zip(missing, text_layers), OCR_DECODE_THREADS, OCR_PREFETCH_PAGES)
+
+    # las páginas se detectan por lotes y luego cada una sigue su
+    # procesamiento de bloques y OCR por separado
+    for batch in batched(pages, DETECTION_BATCH_SIZE, DETECTION_BATCH_MEMORY, lambda p: p['image'].nbytes if p['image'] is not None else 0):
+        if not detect:
+            layouts = [None] * len(batch)
+        else:
+            detect_start = time.perf_counter()
+            layouts = detect_batch(model, [p['image'] for p in batch])
+            # el tiempo del lote se reparte entre sus páginas
+            detect_time = time.perf_counter() - detect_start
+            for p in batch:
+                metrics.add('detect', detect_time / len(batch), p['page'])
+            # las coordenadas de los bloques vuelven a la resolución completa
+            layouts = [layout.scale((p['width'] / p['image'].shape[1], p['height'] / p['image'].shape[0])) for p, layout in zip(batch, layouts)]
+        for page_data, layout in zip(batch, layouts):
+            result = process_page(page_data, layout, stored.get(page_data['page'], []) if existing else None)
+            if use_cache:
+                with metrics.stage('cache', result['page']):
+                    cache.set(keys[result['page']], result['blocks'])
+            resp[result['page']] = result
+            metrics.count('pages')
+            on_progress(1)
+
+    return [resp[page] for page in sorted(resp)]
@@ -0,0 +1,89 @@
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# páginas que se preparan por adelantado mientras se detecta y se hace OCR;
+# con 0 las páginas se leen una a una en el mismo hilo
+OCR_PREFETCH_PAGES = int(os.environ.get('OCR_PREFETCH_PAGES', 4))
+# hilos que leen y decodifican las imágenes de las páginas
+OCR_DECODE_THREADS = int(os.environ.get('OCR_DECODE_THREADS', 2))
+
+_END = object()
+
+
+class Prefetch:
+    # Consume un iterable en un hilo propio y deja hasta `size` elementos
+    # listos en una cola acotada; los elementos salen en el mismo orden.
+    def __init__(self, iterable, size, name='prefetch'):
+        self.queue = queue.Queue(maxsize=max(size, 1))
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(iterable,), name=name, daemon=True)
+        self.thread.start()
+
+    def _put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self, iterable):
+        error = None
+        try:
+            for item in iterable:
+                if not self._put((item, None)):
+                    break
+        except BaseException as e:
+            error = e
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                close()
+        self._put((_END, error))
+
+    def __iter__(self):
+        try:
+            while True:
+                item, error = self.queue.get()
+                if item is _END:
+                    if error is not None:
+                        raise error
+                    return
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        self.stopped.set()
+
+
+def prefetch(iterable, size=OCR_PREFETCH_PAGES, name='prefetch'):
+    if size <= 0:
+        return iter(iterable)
+    return iter(Prefetch(iterable, size, name))
+
+
+def ordered_map(fn, items, workers=OCR_DECODE_THREADS, ahead=OCR_PREFETCH_PAGES):
+    # aplica fn en un pool de hilos con a lo sumo `ahead` elementos en curso y
+    # devuelve los resultados en el orden de entrada
+    if workers <= 0 or ahead <= 0:
+        yield from map(fn, items)
+        return
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prefetch')
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= ahead:
+                yield pending.popleft().result()
+        while len(pending) > 0:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
@@ -0,0 +1,98 @@
+import os
+import base64
+
+# formato de las palabras de cada bloque: 'full' guarda un objeto por palabra
+# y 'compact' guarda por bloque la lista de textos y las cajas empaquetadas
+RESULT_FORMAT = os.environ.get('OCR_RESULT_FORMAT', 'full')
+# dónde se guarda el resultado: 'record' dentro del registro y 'pages' un
+# documento por página en una colección aparte
+RESULT_STORAGE = os.environ.get('OCR_RESULT_STORAGE', 'record')
+PAGES_COLLECTION = os.environ.get('OCR_RESULT_PAGES_COLLECTION', 'ocrProcessing_pages')
+
+
+def pack_boxes(boxes):
+    # cajas (x, y, width, height) normalizadas como float32 consecutivos; en
+    # las tareas viajan en base64 porque el resultado se serializa en JSON
+    import numpy as np
+
+    return base64.b64encode(np.ascontiguousarray(boxes, dtype='<f4').tobytes()).decode('ascii')
+
+
+def unpack_boxes(data):
+    import numpy as np
+
+    if isinstance(data, str):
+        data = base64.b64decode(data)
+    return np.frombuffer(bytes(data), dtype='<f4').reshape(-1, 4)
+
+
+def compact_words(texts, boxes):
+    return {'text': texts, 'bbox': pack_boxes(boxes)}
+
+
+def expand_block(block):
+    # devuelve el bloque con las palabras en el formato completo
+    words = block.get('words')
+    if not isinstance(words, dict):
+        return block
+
+    boxes = unpack_boxes(words['bbox']).tolist()
+    return {**block, 'words': [{
+        'text': text,
+        'bbox': {'x': box[0], 'y': box[1], 'width': box[2], 'height': box[3]}
+    } for text, box in zip(words['text'], boxes)]}
+
+
+def expand_result(result):
+    return [{**page, 'blocks': [expand_block(b) for b in page['blocks']]} for page in result]
+
+
+def _convert_boxes(result, convert):
+    converted = []
+    for page in result:
+        blocks = []
+        for b in page['blocks']:
+            if isinstance(b.get('words'), dict):
+                b = {**b, 'words': {**b['words'], 'bbox': convert(b['words']['bbox'])}}
+            blocks.append(b)
+        converted.append({**page, 'blocks': blocks})
+    return converted
+
+
+def to_storage(result):
+    # en la base de datos las cajas compactas se guardan como binario
+    from bson.binary import Binary
+
+    return _convert_boxes(result, lambda data: Binary(base64.b64decode(data)) if isinstance(data, str) else data)
+
+
+def from_storage(result):
+    return _convert_boxes(result, lambda data: data if isinstance(data, str) else base64.b64encode(bytes(data)).decode('ascii'))
+
+
+def page_documents(record_id, result):
+    return [{
+        '_id': f'{record_id}:{page["page"]}',
+        'record': record_id,
+        'page': page['page'],
+        'blocks': page['blocks']
+    } for page in to_storage(result)]
+
+
+def load_result(ocr_processing, db, record_id, start=None, end=None, expand=False):
+    # lee el resultado de un registro esté dentro del registro o en la
+    # colección de páginas; con expand las palabras vuelven al formato
+    # completo y si no, las cajas compactas quedan en base64
+    if ocr_processing.get('storage') == 'pages':
+        filters = {'record': record_id}
+        if start is not None:
+            filters['page'] = {'$gt': start, '$lte': end}
+        result = sorted(db[PAGES_COLLECTION].find(filters), key=lambda p: p['page'])
+        result = [{'page': p['page'], 'blocks': p['blocks']} for p in result]
+    else:
+        result = ocr_processing.get('result', [])
+        if start is not None:
+            result = [p for p in result if start < p['page'] <= end]
+
+    result = from_storage(result)
+    return expand_result(result) if expand else result
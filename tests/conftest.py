@@ -0,0 +1,31 @@
+# Los tests importan el plugin como el paquete `ocrProcessing` sin una
+# instalación de Archihub: Archihub, Celery y la base de datos se reemplazan
+# por los sustitutos en memoria de los benchmarks, y los modelos de layout por
+# el modelo de prueba de benchmarks/run.py.
+#
+#   python -m pytest -q
+#
+# pytest.ini limita la búsqueda de conftest a tests/ para que pytest no
+# importe la raíz del repositorio, que es el paquete del plugin.
+import os
+import sys
+import tempfile
+
+import pytest
+
+work = tempfile.mkdtemp(prefix='ocrprocessing-tests-')
+for name, value in (('OCR_CACHE_BACKEND', 'none'), ('WEB_FILES_PATH', os.path.join(work, 'web')),
+                    ('ORIGINAL_FILES_PATH', os.path.join(work, 'original'))):
+    os.environ.setdefault(name, value)
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+import run
+
+plugin, standins = run.load_plugin(work)
+
+
+@pytest.fixture(autouse=True)
+def db():
+    # cada test empieza con la base de datos vacía
+    standins.DatabaseHandler.collections.clear()
+    return standins.DatabaseHandler()
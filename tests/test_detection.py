@@ -0,0 +1,99 @@
+# Detección por lotes: detect_batch debe preparar las imágenes como lo hace
+# Detectron2LayoutModel.detect y pasar el lote completo al modelo de
+# detectron2.
+import importlib.util
+
+import numpy as np
+import pytest
+from PIL import Image
+from layoutparser.models.detectron2.layoutmodel import Detectron2LayoutModel
+
+from ocrProcessing.detection import detect_batch, batched
+
+needs_torch = pytest.mark.skipif(importlib.util.find_spec('torch') is None, reason='torch no está instalado')
+
+
+class HalfSize:
+    def apply_image(self, image):
+        return image[::2, ::2]
+
+
+class Resize:
+    def get_transform(self, image):
+        return HalfSize()
+
+
+class Instances:
+    def __init__(self, box):
+        import torch
+
+        self.scores = torch.tensor([0.9])
+        self.pred_boxes = type('Boxes', (), {'tensor': torch.tensor([box])})()
+        self.pred_classes = torch.tensor([0])
+
+    def to(self, device):
+        return self
+
+
+class Network:
+    # devuelve un bloque con el tamaño original de cada imagen del lote
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, inputs):
+        self.calls.append(inputs)
+        return [{'instances': Instances([0.0, 0.0, float(i['width']), float(i['height'])])} for i in inputs]
+
+
+class Predictor:
+    # las partes de DefaultPredictor que usa detect_batch
+    def __init__(self, input_format):
+        self.aug = Resize()
+        self.input_format = input_format
+        self.model = Network()
+
+
+def layout_model(input_format='BGR'):
+    model = object.__new__(Detectron2LayoutModel)
+    model.label_map = {0: 'Text'}
+    model.model = Predictor(input_format)
+    return model
+
+
+@needs_torch
+def test_detect_batch_runs_the_predictor_once_per_batch():
+    model = layout_model()
+    images = [np.zeros((40, 60, 3), np.uint8), Image.new('L', (30, 20))]
+
+    layouts = detect_batch(model, images)
+
+    assert len(model.model.model.calls) == 1
+    inputs = model.model.model.calls[0]
+    assert [tuple(i['image'].shape) for i in inputs] == [(3, 20, 30), (3, 10, 15)]
+    assert [(i['height'], i['width']) for i in inputs] == [(40, 60), (20, 30)]
+    assert [[(b.type, b.block.x_2, b.block.y_2) for b in layout] for layout in layouts] == [[('Text', 60, 40)], [('Text', 30, 20)]]
+
+
+@needs_torch
+def test_detect_batch_follows_the_predictor_input_format():
+    image = np.zeros((4, 4, 3), np.uint8)
+    image[..., 0] = 1
+    image[..., 2] = 3
+
+    for input_format, first_channel in (('BGR', 1), ('RGB', 3)):
+        model = layout_model(input_format)
+        detect_batch(model, [image])
+        assert float(model.model.model.calls[0][0]['image'][0].max()) == first_channel
+
+
+def test_models_without_predictor_use_detect():
+    class Model:
+        def detect(self, image):
+            return image.shape
+
+    assert detect_batch(Model(), [np.zeros((2, 3, 3)), np.zeros((4, 5, 3))]) == [(2, 3, 3), (4, 5, 3)]
+
+
+def test_batched_respects_size_and_memory():
+    assert list(batched(range(5), 2, 100, lambda i: 1)) == [[0, 1], [2, 3], [4]]
+    assert list(batched([10, 60, 50, 200, 5], 4, 100, lambda i: i)) == [[10, 60], [50], [200], [5]]
@@ -0,0 +1,125 @@
+# Modo 'existing': solo se vuelven a extraer los bloques que el editor cambió
+# desde la última extracción y los de los tipos pedidos.
+import os
+
+import pytest
+from bson.objectid import ObjectId
+
+import ocrProcessing as plugin
+from ocrProcessing import pipeline
+from ocrProcessing.pipeline import block_fingerprint
+from synthetic import make_document
+
+DOCUMENT = 'scan/existing'
+
+
+class Pool:
+    def __init__(self):
+        self.images = 0
+
+    def map(self, images):
+        self.images += len(images)
+        return ['OCR'] * len(images)
+
+
+@pytest.fixture(scope='module', autouse=True)
+def document():
+    make_document(os.environ['WEB_FILES_PATH'], os.environ['ORIGINAL_FILES_PATH'], DOCUMENT, 2, text_layer=False, n_lines=8)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = Pool()
+    monkeypatch.setattr(pipeline, 'get_ocr_pool', lambda: pool)
+    detections = []
+    detect_batch = pipeline.detect_batch
+    monkeypatch.setattr(pipeline, 'detect_batch', lambda model, images: detections.append(len(images)) or detect_batch(model, images))
+    pool.detections = detections
+    return pool
+
+
+@pytest.fixture
+def record(db, pool):
+    record_id = ObjectId()
+    db['records'].insert_one({'_id': record_id, 'processing': {'fileProcessing': {'type': 'document', 'path': DOCUMENT}}})
+    plugin.ExtendedPluginClass.bulk({'records': [str(record_id)], 'model': 'bench', 'overwrite': True, 'ocr_types': ['Text']}, 'u')
+    pool.images = 0
+    pool.detections.clear()
+    return record_id
+
+
+def ocr_processing(db, record_id):
+    return db['records'].docs[record_id]['processing']['ocrProcessing']
+
+
+def existing(record_id, ocr_types=None):
+    body = {'records': [str(record_id)], 'model': 'existing'}
+    if ocr_types is not None:
+        body['ocr_types'] = ocr_types
+    plugin.ExtendedPluginClass.bulk(body, 'u')
+
+
+def test_fingerprint_follows_type_and_box():
+    block = {'type': 'Text', 'bbox': {'x': 0.1, 'y': 0.2, 'width': 0.3, 'height': 0.05}}
+    assert block_fingerprint(block) == block_fingerprint({**block, 'text': 'otro'})
+    assert block_fingerprint(block) != block_fingerprint({**block, 'type': 'Title'})
+    assert block_fingerprint(block) != block_fingerprint({**block, 'bbox': {**block['bbox'], 'x': 0.11}})
+
+
+def test_extracted_blocks_keep_their_fingerprint(db, record):
+    blocks = [b for p in ocr_processing(db, record)['result'] for b in p['blocks']]
+    assert len(blocks) > 0
+    assert all(b['fingerprint'] == block_fingerprint(b) for b in blocks)
+
+
+def test_unchanged_blocks_are_not_processed(db, record, pool):
+    before = ocr_processing(db, record)['result']
+    existing(record)
+
+    assert (pool.images, pool.detections) == (0, [])
+    after = ocr_processing(db, record)
+    assert after['result'] == before
+    assert after['summary']['counters']['ocr_blocks'] == 0
+    assert after['model'] == 'bench'
+
+
+def test_edited_block_is_extracted_again(db, record, pool):
+    result = ocr_processing(db, record)['result']
+    block = result[1]['blocks'][0]
+    assert block['type'] == 'Title' and 'text' not in block
+    block['type'] = 'Text'
+    untouched = [b for p in result for b in p['blocks'] if b is not block]
+
+    existing(record)
+
+    after = ocr_processing(db, record)
+    assert after['summary']['counters']['ocr_blocks'] == 1
+    assert pool.detections == []
+    edited = after['result'][1]['blocks'][0]
+    assert (edited['type'], edited['text']) == ('Text', 'OCR')
+    assert edited['fingerprint'] == block_fingerprint(edited)
+    assert [b for p in after['result'] for b in p['blocks'] if b is not edited] == untouched
+
+
+def test_moved_block_is_extracted_again(db, record):
+    result = ocr_processing(db, record)['result']
+    moved, kept = [b for b in result[0]['blocks'] if b['type'] == 'Text'][:2]
+    moved['bbox'] = {**moved['bbox'], 'height': moved['bbox']['height'] * 1.1}
+    moved['text'] = kept['text'] = 'editado'
+
+    existing(record)
+
+    after = ocr_processing(db, record)
+    assert after['summary']['counters']['ocr_blocks'] == 1
+    texts = {b['fingerprint']: b['text'] for b in after['result'][0]['blocks'] if 'text' in b}
+    assert texts[block_fingerprint(moved)] == 'OCR'
+    assert texts[kept['fingerprint']] == 'editado'
+
+
+def test_requested_types_are_always_extracted(db, record):
+    titles = sum(b['type'] == 'Title' for p in ocr_processing(db, record)['result'] for b in p['blocks'])
+    existing(record, ['Title'])
+
+    after = ocr_processing(db, record)
+    assert after['summary']['counters']['ocr_blocks'] == titles
+    assert all(b['text'] == 'OCR' for p in after['result'] for b in p['blocks'] if b['type'] == 'Title')
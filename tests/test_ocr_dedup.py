@@ -0,0 +1,58 @@
+# Reutilización del texto de OCR entre recortes repetidos: los pies de
+# página con número no pueden tomar el texto de otra página.
+import cv2
+import numpy as np
+import pytest
+
+from ocrProcessing import ocr_dedup
+
+
+def footer(text, dx=0, dy=0):
+    # pie de página escaneado: texto en una franja blanca y compresión JPEG
+    image = np.full((120, 700, 3), 255, np.uint8)
+    cv2.putText(image, text, (40 + dx, 70 + dy), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 0), 2, cv2.LINE_AA)
+    _, data = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    return cv2.imdecode(data, cv2.IMREAD_COLOR)[..., ::-1]
+
+
+def cached(*texts):
+    cache = ocr_dedup.OCRDedupCache(size=100)
+    for text in texts:
+        cache.set('job', ocr_dedup.block_signature(footer(text)), text)
+    return cache
+
+
+def test_same_footer_reuses_text():
+    cache = cached('Pagina 12 de 400')
+    assert cache.get('job', ocr_dedup.block_signature(footer('Pagina 12 de 400', 3, 2))) == 'Pagina 12 de 400'
+
+
+@pytest.mark.parametrize('stored, page', [
+    ('Pagina 12 de 400', 'Pagina 13 de 400'),
+    ('Pagina 8 de 400', 'Pagina 6 de 400'),
+    ('Pagina 11 de 400', 'Pagina 17 de 400'),
+])
+def test_page_number_footers_are_not_reused(stored, page):
+    cache = cached(stored)
+    assert cache.get('job', ocr_dedup.block_signature(footer(page))) is None
+
+
+def test_page_number_footers_keep_their_own_text():
+    pages = [f'Pagina {n} de 400' for n in range(1, 21)]
+    cache = cached(*pages)
+    for text in pages:
+        assert cache.get('job', ocr_dedup.block_signature(footer(text, 1, 1))) == text
+
+
+def test_scopes_are_separate():
+    cache = cached('Pagina 12 de 400')
+    assert cache.get('other', ocr_dedup.block_signature(footer('Pagina 12 de 400'))) is None
+
+
+def test_memory_limit_evicts_oldest():
+    signature = ocr_dedup.block_signature(footer('Pagina 1 de 400'))
+    cache = ocr_dedup.OCRDedupCache(size=100, memory=signature[2].nbytes * 2)
+    for n in range(1, 4):
+        cache.set('job', ocr_dedup.block_signature(footer(f'Pagina {n} de 400')), n)
+    assert cache.get('job', signature) is None
+    assert cache.get('job', ocr_dedup.block_signature(footer('Pagina 3 de 400'))) == 3
@@ -0,0 +1,70 @@
+# Formatos del resultado: las palabras compactas y el almacenamiento por
+# página deben devolver el mismo resultado que se guardó.
+import numpy as np
+import pytest
+from bson.binary import Binary
+from bson.objectid import ObjectId
+
+from ocrProcessing import result_storage
+from ocrProcessing.result_storage import compact_words, expand_result, from_storage, load_result, page_documents, to_storage
+
+BOXES = [(0.1, 0.2, 0.05, 0.01), (0.3, 0.25, 0.125, 0.015)]
+
+
+def full_page(page):
+    return {'page': page, 'blocks': [{
+        'type': 'Text',
+        'text': 'folio carta',
+        'words': [{'text': t, 'bbox': dict(zip(('x', 'y', 'width', 'height'), box))} for t, box in zip(('folio', 'carta'), BOXES)]
+    }, {'type': 'Title'}]}
+
+
+def compact_page(page):
+    return {'page': page, 'blocks': [{'type': 'Text', 'text': 'folio carta', 'words': compact_words(['folio', 'carta'], BOXES)}, {'type': 'Title'}]}
+
+
+def assert_same_words(result, expected):
+    assert [p['page'] for p in result] == [p['page'] for p in expected]
+    for page, other in zip(result, expected):
+        for block, other_block in zip(page['blocks'], other['blocks']):
+            assert [w['text'] for w in block.get('words', [])] == [w['text'] for w in other_block.get('words', [])]
+            for w, other_w in zip(block.get('words', []), other_block.get('words', [])):
+                # las cajas compactas son float32
+                assert w['bbox'] == pytest.approx(other_w['bbox'], abs=1e-7)
+
+
+def test_compact_words_expand_to_full():
+    assert_same_words(expand_result([compact_page(1)]), [full_page(1)])
+
+
+def test_boxes_are_binary_in_the_database():
+    stored = to_storage([compact_page(1)])
+    data = stored[0]['blocks'][0]['words']['bbox']
+    assert isinstance(data, Binary)
+    assert np.frombuffer(bytes(data), dtype='<f4').reshape(-1, 4) == pytest.approx(np.array(BOXES), abs=1e-7)
+    assert from_storage(stored) == [compact_page(1)]
+    # el formato completo no cambia
+    assert from_storage(to_storage([full_page(1)])) == [full_page(1)]
+
+
+@pytest.mark.parametrize('make_page', [full_page, compact_page])
+def test_record_storage_round_trip(db, make_page):
+    result = to_storage([make_page(n) for n in (1, 2, 3)])
+    ocr_processing = {'storage': 'record', 'result': result}
+    record_id = ObjectId()
+
+    assert load_result(ocr_processing, db, record_id) == [make_page(n) for n in (1, 2, 3)]
+    assert [p['page'] for p in load_result(ocr_processing, db, record_id, 1, 3)] == [2, 3]
+    assert_same_words(load_result(ocr_processing, db, record_id, expand=True), [full_page(n) for n in (1, 2, 3)])
+
+
+@pytest.mark.parametrize('make_page', [full_page, compact_page])
+def test_pages_storage_round_trip(db, make_page):
+    record_id = ObjectId()
+    db[result_storage.PAGES_COLLECTION].insert_many(page_documents(record_id, [make_page(n) for n in (3, 1, 2)]))
+    db[result_storage.PAGES_COLLECTION].insert_many(page_documents(ObjectId(), [make_page(1)]))
+    ocr_processing = {'storage': 'pages'}
+
+    assert load_result(ocr_processing, db, record_id) == [make_page(n) for n in (1, 2, 3)]
+    assert [p['page'] for p in load_result(ocr_processing, db, record_id, 0, 2)] == [1, 2]
+    assert_same_words(load_result(ocr_processing, db, record_id, expand=True), [full_page(n) for n in (1, 2, 3)])
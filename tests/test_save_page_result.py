@@ -0,0 +1,105 @@
+# Guardado de una sola página desde el editor: la página reemplaza su entrada
+# o se inserta en orden, sin duplicarse aunque otra solicitud se adelante.
+import types
+
+import pytest
+from bson.objectid import ObjectId
+
+import ocrProcessing as plugin
+
+
+def page(n, text):
+    return {'page': n, 'blocks': [{'type': 'Text', 'text': text}]}
+
+
+def stored(db, record_id):
+    return db['records'].docs[record_id]['processing']['ocrProcessing']
+
+
+@pytest.fixture
+def record(db):
+    record_id = ObjectId()
+    db['records'].insert_one({'_id': record_id, 'processing': {'ocrProcessing': {
+        'type': 'lt_extraction',
+        'model': 'bench',
+        'labels': {'0': 'Title'},
+        'storage': 'record',
+        'result': [page(1, 'uno'), page(3, 'tres')],
+        'summary': {'old': True}
+    }}})
+    return record_id
+
+
+def test_creates_the_result_with_the_page(db):
+    record_id = ObjectId()
+    db['records'].insert_one({'_id': record_id})
+    plugin.save_page_result(str(record_id), page(2, 'dos'), {'model': 'bench'}, 'u', {'new': True})
+
+    ocr_processing = stored(db, record_id)
+    assert ocr_processing['result'] == [page(2, 'dos')]
+    assert ocr_processing['model'] == 'bench'
+    assert ocr_processing['labels'] == {'0': 'Title', '1': 'Text'}
+    assert ocr_processing['summary'] == {'new': True}
+
+
+def test_replaces_the_page_in_place(db, record):
+    plugin.save_page_result(str(record), page(3, 'otra'), {'model': 'bench'}, 'u', {'new': True})
+
+    ocr_processing = stored(db, record)
+    assert ocr_processing['result'] == [page(1, 'uno'), page(3, 'otra')]
+    assert ocr_processing['labels'] == {'0': 'Title', '1': 'Text'}
+    assert ocr_processing['summary'] == {'new': True}
+    assert db['records'].docs[record]['updatedBy'] == 'u'
+
+
+def test_inserts_a_new_page_in_order(db, record):
+    plugin.save_page_result(str(record), page(2, 'dos'), {'model': 'bench'}, 'u')
+
+    ocr_processing = stored(db, record)
+    assert ocr_processing['result'] == [page(1, 'uno'), page(2, 'dos'), page(3, 'tres')]
+    # sin resumen nuevo se conserva el anterior
+    assert ocr_processing['summary'] == {'old': True}
+
+
+def test_page_added_by_another_request_is_not_duplicated(db, record):
+    # otra solicitud guarda la página 2 justo antes del $push de esta, que
+    # no aplica; el siguiente intento la reemplaza en su lugar
+    records = db['records']
+    update_one = records.update_one
+
+    def racing_update_one(filters, update, **kwargs):
+        if '$push' in update and not racing_update_one.raced:
+            racing_update_one.raced = True
+            update_one({'_id': record}, {'$push': {'processing.ocrProcessing.result': {'$each': [page(2, 'antes')], '$sort': {'page': 1}}}})
+        return update_one(filters, update, **kwargs)
+
+    racing_update_one.raced = False
+    records.update_one = racing_update_one
+    try:
+        plugin.save_page_result(str(record), page(2, 'dos'), {'model': 'bench'}, 'u')
+    finally:
+        records.update_one = update_one
+
+    assert racing_update_one.raced
+    assert stored(db, record)['result'] == [page(1, 'uno'), page(2, 'dos'), page(3, 'tres')]
+
+
+def test_existing_mode_keeps_the_model_and_labels(db, record):
+    plugin.save_page_result(str(record), page(1, 'nuevo'), {'model': 'existing'}, 'u', {'new': True})
+
+    ocr_processing = stored(db, record)
+    assert ocr_processing['result'] == [page(1, 'nuevo'), page(3, 'tres')]
+    assert (ocr_processing['model'], ocr_processing['labels']) == ('bench', {'0': 'Title'})
+    assert ocr_processing['summary'] == {'new': True}
+
+
+def test_rejects_a_page_from_another_model(db, record):
+    with pytest.raises(Exception, match='modelo bench'):
+        plugin.save_page_result(str(record), page(2, 'dos'), {'model': '*'}, 'u')
+    assert [p['page'] for p in stored(db, record)['result']] == [1, 3]
+
+
+def test_raises_when_every_attempt_misses(db, record):
+    db['records'].update_one = lambda filters, update, **kwargs: types.SimpleNamespace(matched_count=0)
+    with pytest.raises(Exception, match='No se pudo guardar la página 2'):
+        plugin.save_page_result(str(record), page(2, 'dos'), {'model': 'bench'}, 'u')
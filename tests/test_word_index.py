@@ -0,0 +1,44 @@
+# Asignación de palabras a bloques: WordIndex debe devolver lo mismo que el
+# recorrido lineal que hacía extract_words_bbox, en el mismo orden.
+import pytest
+
+from bench_word_index import synthetic_page, synthetic_blocks
+from ocrProcessing.word_index import WordIndex
+
+
+def extract_words_bbox(words, bbox, page_w, page_h):
+    resp = []
+    for word in words:
+        if word['x0'] / page_w >= bbox['x_1'] and word['x1'] / page_w <= bbox['x_2'] and word['top'] / page_h >= bbox['y_1'] and word['bottom'] / page_h <= bbox['y_2']:
+            resp.append(word)
+    return resp
+
+
+@pytest.mark.parametrize('n_words, cells', [(1, None), (40, None), (3000, None), (500, 1), (500, 64)])
+def test_matches_linear_scan(n_words, cells):
+    words, page_w, page_h = synthetic_page(n_words, seed=n_words)
+    index = WordIndex(words, page_w, page_h, cells=cells)
+    for bbox in synthetic_blocks(60, seed=n_words + 1):
+        assert index.query(bbox) == extract_words_bbox(words, bbox, page_w, page_h)
+
+
+def test_words_on_the_block_edges():
+    words = [
+        {'text': 'a', 'x0': 100, 'x1': 200, 'top': 100, 'bottom': 150},
+        {'text': 'b', 'x0': 0, 'x1': 50, 'top': 0, 'bottom': 10},
+        {'text': 'c', 'x0': 950, 'x1': 1000, 'top': 990, 'bottom': 1000},
+        {'text': 'd', 'x0': 99, 'x1': 200, 'top': 100, 'bottom': 150}
+    ]
+    index = WordIndex(words, 1000, 1000, cells=4)
+    for bbox in ({'x_1': 0.1, 'y_1': 0.1, 'x_2': 0.2, 'y_2': 0.15},
+                 {'x_1': 0.0, 'y_1': 0.0, 'x_2': 1.0, 'y_2': 1.0},
+                 {'x_1': -0.5, 'y_1': -0.5, 'x_2': 1.5, 'y_2': 1.5},
+                 {'x_1': 0.95, 'y_1': 0.99, 'x_2': 1.0, 'y_2': 1.0},
+                 {'x_1': 0.6, 'y_1': 0.6, 'x_2': 0.4, 'y_2': 0.4}):
+        assert index.query(bbox) == extract_words_bbox(words, bbox, 1000, 1000)
+
+
+def test_page_without_words():
+    index = WordIndex(None, 612, 792)
+    assert len(index) == 0
+    assert index.query({'x_1': 0, 'y_1': 0, 'x_2': 1, 'y_2': 1}) == []
@@ -0,0 +1,17 @@
+import pdfplumber
+
+
+def iter_text_layer(pdf_path, pages=None):
+    # Abre el PDF una sola vez y recorre sus páginas en orden, entregando
+    # (page_index, has_text, words, width, height). `pages` usa la numeración
+    # de pdfplumber (desde 1) para limitar las páginas que se cargan.
+    with pdfplumber.open(pdf_path, pages=pages) as pdf:
+        for page_ in pdf.pages:
+            has_text = len(page_.chars) > 0
+            words = page_.extract_words() if has_text else None
+
+            yield page_.page_number - 1, has_text, words, page_.width, page_.height
+
+            # liberamos los objetos cacheados de la página para que la memoria
+            # no crezca con el número de páginas del documento
+            page_.close()
@@ -0,0 +1,62 @@
+import numpy as np
+
+
+class WordIndex:
+    # Índice espacial de las palabras de una página. Las cajas se normalizan
+    # una sola vez y se reparten en una rejilla uniforme según su esquina
+    # superior izquierda: una palabra contenida en un bloque tiene esa esquina
+    # dentro del bloque, así que solo se revisan las celdas que lo cubren.
+    def __init__(self, words, page_w, page_h, cells=None):
+        self.words = words or []
+        n = len(self.words)
+
+        boxes = np.array([(w['x0'], w['top'], w['x1'], w['bottom']) for w in self.words], dtype=np.float64).reshape(n, 4)
+        self.x0 = boxes[:, 0] / page_w
+        self.y0 = boxes[:, 1] / page_h
+        self.x1 = boxes[:, 2] / page_w
+        self.y1 = boxes[:, 3] / page_h
+
+        if cells is None:
+            cells = int(np.clip(np.sqrt(n / 4), 1, 64))
+        self.cells = cells
+
+        col = self._cell(self.x0)
+        row = self._cell(self.y0)
+        cell_id = row * cells + col
+
+        # los índices se guardan agrupados por celda (CSR): las palabras de la
+        # celda c están en order[start[c]:start[c + 1]]
+        self.order = np.argsort(cell_id, kind='stable')
+        counts = np.bincount(cell_id, minlength=cells * cells)
+        self.start = np.concatenate(([0], np.cumsum(counts)))
+
+    def __len__(self):
+        return len(self.words)
+
+    def _cell(self, v):
+        return np.clip((np.asarray(v) * self.cells).astype(np.int64), 0, self.cells - 1)
+
+    def query_indices(self, bbox):
+        if len(self.words) == 0:
+            return np.empty(0, dtype=np.int64)
+
+        c0, c1 = self._cell([bbox['x_1'], bbox['x_2']])
+        r0, r1 = self._cell([bbox['y_1'], bbox['y_2']])
+
+        if r0 > r1 or c0 > c1:
+            return np.empty(0, dtype=np.int64)
+
+        # en cada fila de la rejilla las celdas [c0, c1] son contiguas
+        candidates = np.concatenate([
+            self.order[self.start[r * self.cells + c0]:self.start[r * self.cells + c1 + 1]]
+            for r in range(r0, r1 + 1)
+        ])
+
+        mask = (self.x0[candidates] >= bbox['x_1']) & (self.x1[candidates] <= bbox['x_2']) \
+            & (self.y0[candidates] >= bbox['y_1']) & (self.y1[candidates] <= bbox['y_2'])
+
+        # se conserva el orden de lectura original de pdfplumber
+        return np.sort(candidates[mask])
+
+    def query(self, bbox):
+        return [self.words[i] for i in self.query_indices(bbox)]